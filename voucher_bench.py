@@ -0,0 +1,361 @@
+"""
+تولید فایل تنخواه مصنوعی و سنجش سرعت ساخت سند.
+
+نمونه:
+    python voucher_bench.py --sizes 1000 10000 100000 1000000
+    python voucher_bench.py --save bench_baseline.json
+    python voucher_bench.py --compare bench_baseline.json
+    python voucher_bench.py --write-sample sample.xlsx --rows 500
+
+برای هر سناریو (الماسی با ناحیه، پرداخت جمعی در پروژه پرند، دفتر مرکزی
+عطا) و هر اندازه، زمان و حافظه اوج هر مرحله و تعداد ردیف در ثانیه گزارش
+می‌شود.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from voucher_engine import (
+    TEMPLATE_PATH, build_voucher, build_voucher_parallel, normalize_frame, read_tankhah, write_voucher,
+)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# شرح‌های نمونه؛ بیشترشان یکی از کلیدواژه‌ها را دارند
+SAMPLE_DESCS = (
+    "خرید آب معدنی کارگاه",
+    "کرایه حمل مصالح",
+    "تخلیه و بارگیری بار",
+    "بیمه تجهیزات",
+    "تست آزمایشگاه بتن",
+    "خرید مواد شوینده",
+    "نهار کارگران",
+    "شام جلسه",
+    "اسنپ کارکنان",
+    "بلیط هواپیما ماموریت",
+    "هتل ماموریت",
+    "پرینت نقشه",
+    "خرید لباس کار",
+    "بنزین خودرو",
+    "اجاره جرثقیل",
+    "اجرت تعمیرکار",
+    "تعویض قطعه",
+    "نظافت کارگاه",
+    "ارسال مدارک",
+    "اوردن بار از انبار",
+    "هزینه متفرقه",
+    "خرید ابزار",
+)
+SAMPLE_SELLERS = ("فروشگاه رضایی", "فروشگاه امید", "شرکت پارس", "آقای کریمی", "")
+
+SCENARIOS = {
+    "almasi_areas": {
+        "tanakh_number": "101",
+        "tanakh_name": "اقای الماسی",
+        "date_input": "1403/03/12",
+        "project_name": "تهران",
+        "sath4_default": "5021",
+        "sath5_default": "7",
+        "sath4_fee_input": "",
+    },
+    "parand_groups": {
+        "tanakh_number": "102",
+        "tanakh_name": "اقای حقی",
+        "date_input": "1403/03/12",
+        "project_name": "پرند",
+        "sath4_default": "5021",
+        "sath5_default": "7",
+        "sath4_fee_input": "5030",
+    },
+    "office_ata": {
+        "tanakh_number": "103",
+        "tanakh_name": "اقا عطا",
+        "date_input": "1403/03/12",
+        "project_name": "دفتر مرکزی",
+        "sath4_default": "5021",
+        "sath5_default": "6003",
+        "sath4_fee_input": "",
+    },
+}
+
+
+def _runs(rng, n, mean_len):
+    """شماره اجرای هر ردیف برای اجراهای پشت‌سرهم با طول میانگین mean_len."""
+    batch = n // mean_len + 1
+    lengths = rng.geometric(1 / mean_len, size=batch)
+    while lengths.sum() < n:
+        lengths = np.concatenate([lengths, rng.geometric(1 / mean_len, size=batch)])
+    return np.repeat(np.arange(len(lengths)), lengths)[:n]
+
+
+def generate_tankhah(n_rows, seed=0, messy=False):
+    """
+    دیتافریم تنخواه مصنوعی با همه شاخه‌های حلقه سند.
+
+    ناحیه‌ها و پرداخت جمعی اجراهای پشت‌سرهم‌اند؛ بعد از بعضی گروه‌ها یک
+    ردیف «بابت ... فقره» بدون مبلغ می‌آید. رسید انبار، گردش، شماره فاکتور
+    بازه‌ای (2532-2534) و مرکز هزینه هم در داده هست. با messy=True در
+    ستون‌ها مقدارهای نامرتب فایل‌های واقعی (خالی، '-'، ویرگول هزارگان، ارقام
+    فارسی، متن به جای عدد) هم پخش می‌شود.
+    """
+    rng = np.random.default_rng(seed)
+    n = n_rows
+
+    # ناحیه: اجراهای پشت‌سرهم؛ حدود ۱۰٪ اجراها بدون ناحیه
+    area_run = _runs(rng, n, 25)
+    area_labels = rng.integers(1, 15, size=area_run.max() + 1).astype(str).astype(object)
+    area_labels[rng.random(len(area_labels)) < 0.1] = ""
+    area = area_labels[area_run]
+
+    # پرداخت جمعی: اجراهای یک‌درمیان گروهی/عادی
+    group_run = _runs(rng, n, 6)
+    in_group = (group_run % 2 == 1) & (rng.random(group_run.max() + 1) < 0.6)[group_run]
+    group = np.where(in_group, 1.0, np.nan)
+
+    amount = rng.integers(1, 500, size=n) * 10_000.0
+    tax = np.where(rng.random(n) < 0.4, np.round(amount * 0.09), 0.0)
+    fee = np.where(rng.random(n) < 0.3, rng.choice([5_000.0, 10_000.0, 15_000.0], size=n), 0.0)
+
+    # ردیف «بابت ... فقره» بعد از انتهای گروه: بدون مبلغ
+    group_end = np.zeros(n, dtype=bool)
+    group_end[1:] = in_group[:-1] & ~in_group[1:]
+    closer = group_end & (rng.random(n) < 0.5)
+    amount[closer] = tax[closer] = fee[closer] = 0.0
+
+    desc = rng.choice(np.array(SAMPLE_DESCS, dtype=object), size=n)
+    desc[closer] = "بابت پرداخت جمعی فاکتورها"
+
+    factor = rng.integers(1000, 99999, size=n).astype(object)
+    ranged = rng.random(n) < 0.05
+    factor[ranged] = [f"{f}-{f + 2}" for f in factor[ranged]]
+    factor[rng.random(n) < 0.2] = np.nan
+
+    resi = np.full(n, np.nan, dtype=object)
+    has_resi = rng.random(n) < 0.05
+    resi[has_resi] = rng.integers(100, 9999, size=has_resi.sum())
+
+    months = rng.integers(1, 13, size=n)
+    days = rng.integers(1, 30, size=n)
+    cost_date = np.array([f"1403/{m:02d}/{d:02d}" for m, d in zip(months, days)], dtype=object)
+
+    gardesh = np.where(rng.random(n) < 0.03, "گردش", None)
+    center_cost = np.where(rng.random(n) < 0.8, rng.integers(5000, 5100, size=n).astype(float), np.nan)
+
+    df = pd.DataFrame(
+        {
+            "ناحیه": area,
+            "شرح سند": desc,
+            "نام فروشنده / فروشگاه": rng.choice(np.array(SAMPLE_SELLERS, dtype=object), size=n),
+            "شماره فاکتور": factor,
+            "رسیدانبار": resi,
+            "تاریخ": cost_date,
+            "کارمزد": fee,
+            "ارزش افزوده": tax,
+            "مبلغ": amount,
+            "گردش": gardesh,
+            "پرداخت جمعی": group,
+            "مرکز هزینه": center_cost,
+        }
+    )
+    if messy:
+        _make_messy(df, rng)
+    return df
+
+
+# مقدارهای نامرتب برای هر ستون در حالت messy
+MESSY_VALUES = {
+    "ناحیه": (np.nan, 3.0, " 2 ", ""),
+    "شرح سند": (np.nan, "  ", " خريد آب ", "nan", "بابت کرایه حمل"),
+    "نام فروشنده / فروشگاه": (np.nan, "فروشگاه", " شرکت  پارس "),
+    "شماره فاکتور": (" 123 ", "12.0", "abc", "-", "10 - 12 - x", 0),
+    "رسیدانبار": ("55.0", "10-11", "-", "None", " "),
+    "تاریخ": (np.nan, 0, "nan", pd.Timestamp("2024-03-20")),
+    "کارمزد": ("-", "", "1,000", "abc", np.nan),
+    "ارزش افزوده": ("1,200", "۹۰۰۰", " ", np.nan),
+    "مبلغ": ("25,000", "۱۲۰۰۰", "-", "nan", 3.5, np.nan),
+    "گردش": (" گردش ", "گردش", "ندارد"),
+    "پرداخت جمعی": ("x", 0, "0", 2, " "),
+    "مرکز هزینه": ("ab34", "-", "5021", 12.0),
+}
+
+
+# شکل دیگر نام تنخواه‌دار و پروژه هر سناریو که voucher_text با SCENARIOS یکی می‌کند
+VARIANT_HEADERS = {
+    "almasi_areas": {"tanakh_name": "آقای الماسي", "project_name": "تهران "},
+    "parand_groups": {"tanakh_name": "اقاي  حقي", "project_name": " پرند"},
+    "office_ata": {"tanakh_name": "آقا عطا", "project_name": "دفتر مركزي"},
+}
+
+# ي/ك عربی، نیم‌فاصله به جای فاصله و ارقام فارسی
+_VARIANT_CHARS = str.maketrans({"ی": "ي", "ک": "ك", " ": "\u200c", **{str(i): d for i, d in enumerate("۰۱۲۳۴۵۶۷۸۹")}})
+
+
+def text_variants(df, seed=0, share=0.5):
+    """
+    جفت (df پایه، df با شکل دیگر متن) برای آزمون یکسان‌سازی متن (voucher_text).
+
+    در حدود share از ردیف‌ها شرح در هر دو یک شماره می‌گیرد («خرید ابزار 3
+    عدد») و در نسخه دوم شرح و نام فروشنده با ي/ك عربی، نیم‌فاصله و ارقام
+    فارسی (و شرح با کشیده) نوشته می‌شود؛ سند نسخه دوم باید همان کدهای معین و
+    سطح‌های df پایه را داشته باشد. نام فروشنده کشیده نمی‌گیرد چون «فروشگاه»
+    اول آن با متن خام حذف می‌شود.
+    """
+    rng = np.random.default_rng(seed)
+    base, variant = df.copy(), df.copy()
+    numbered = rng.random(len(df)) < share
+    counts = rng.integers(1, 30, size=len(df))
+    desc = base["شرح سند"].to_numpy(dtype=object, copy=True)
+    desc[numbered] = [f"{d} {c} عدد" for d, c in zip(desc[numbered], counts[numbered])]
+    base["شرح سند"] = desc
+    for col in ("شرح سند", "نام فروشنده / فروشگاه"):
+        values = base[col].to_numpy(dtype=object, copy=True)
+        changed = (rng.random(len(df)) < share) & np.array([isinstance(v, str) and len(v) > 1 for v in values])
+        # کشیده بعد از حرف اول شرح
+        tatweel = "\u0640" if col == "شرح سند" else ""
+        values[changed] = [v[0] + tatweel + v[1:].translate(_VARIANT_CHARS) for v in values[changed]]
+        variant[col] = pd.Series(values, index=df.index, dtype=object)
+    return base, variant
+
+
+def _make_messy(df, rng, share=0.15):
+    """جایگزینی حدود share از هر ستون با یکی از MESSY_VALUES آن ستون."""
+    for col, values in MESSY_VALUES.items():
+        mask = rng.random(len(df)) < share
+        column = df[col].to_numpy(dtype=object, copy=True)
+        picks = rng.integers(0, len(values), size=mask.sum())
+        column[mask] = [values[i] for i in picks]
+        df[col] = pd.Series(column, index=df.index, dtype=object)
+
+
+def _measure(func, *args, memory=True):
+    """
+    اجرای func و برگرداندن (نتیجه، ثانیه، حافظه اوج به مگابایت).
+
+    tracemalloc خودش کار را چند برابر کند می‌کند، پس زمان از یک اجرای بدون
+    ردگیری می‌آید و حافظه اوج از یک اجرای دوم با ردگیری.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak = 0
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def bench_case(df, header, with_io=False, memory=True, workers=1):
+    """
+    زمان و حافظه اوج هر مرحله برای یک دیتافریم و سربرگ.
+
+    با workers بیش از یک، حلقه با build_voucher_parallel ساخته می‌شود (حافظه
+    اوج فقط پروسه اصلی است).
+    """
+    stages = {}
+    if with_io:
+        buf = BytesIO()
+        df.to_excel(buf, index=False)
+        data = buf.getvalue()
+        df, seconds, peak = _measure(lambda: read_tankhah(BytesIO(data)), memory=memory)
+        stages["read"] = {"seconds": seconds, "peak_mb": peak}
+    _, seconds, peak = _measure(normalize_frame, df, memory=memory)
+    stages["normalize"] = {"seconds": seconds, "peak_mb": peak}
+    # build_voucher خودش normalize را هم اجرا می‌کند؛ زمان حلقه = تفاضل
+    if workers > 1:
+        lines, seconds, peak = _measure(build_voucher_parallel, df, header, workers, memory=memory)
+    else:
+        lines, seconds, peak = _measure(build_voucher, df, header, memory=memory)
+    stages["loop"] = {"seconds": max(seconds - stages["normalize"]["seconds"], 0.0), "peak_mb": peak}
+    data, seconds, peak = _measure(write_voucher, lines, TEMPLATE_PATH, None, workers > 1, memory=memory)
+    stages["write"] = {"seconds": seconds, "peak_mb": peak}
+
+    total = sum(st["seconds"] for st in stages.values())
+    return {
+        "rows": len(df),
+        "lines": len(lines),
+        "output_bytes": len(data),
+        "seconds": total,
+        "rows_per_sec": len(df) / total if total else 0.0,
+        "stages": stages,
+    }
+
+
+def run_bench(sizes=DEFAULT_SIZES, scenarios=tuple(SCENARIOS), seed=0, with_io=False, memory=True, workers=1):
+    """اجرای همه سناریوها برای همه اندازه‌ها؛ خروجی {"سناریو/اندازه": نتیجه}."""
+    results = {}
+    for size in sizes:
+        df = generate_tankhah(size, seed)
+        for name in scenarios:
+            key = f"{name}/{size}"
+            results[key] = bench_case(df, SCENARIOS[name], with_io, memory, workers)
+            print(format_result(key, results[key]), flush=True)
+    return results
+
+
+def format_result(key, result, baseline=None):
+    """یک خط گزارش برای نتیجه؛ با baseline نسبت سرعت هم نوشته می‌شود."""
+    stages = " ".join(
+        f"{name}={st['seconds']:.3f}s/{st['peak_mb']:.0f}MB" for name, st in result["stages"].items()
+    )
+    line = (
+        f"{key:<28} {result['rows']:>9} ردیف {result['lines']:>9} سطر "
+        f"{result['rows_per_sec']:>10.0f} ردیف/ث | {stages}"
+    )
+    if baseline is not None and baseline.get("rows_per_sec"):
+        line += f" | ×{result['rows_per_sec'] / baseline['rows_per_sec']:.2f} نسبت به مبنا"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="سنجش سرعت ساخت سند تنخواه")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-io", action="store_true", help="خواندن از xlsx را هم بسنج")
+    parser.add_argument("--no-memory", action="store_true", help="حافظه اوج را نسنج (اجرای دوم هر مرحله حذف می‌شود)")
+    parser.add_argument("--workers", type=int, default=1, help="ساخت موازی هر فایل با این تعداد پروسه")
+    parser.add_argument("--save", help="ذخیره نتیجه به عنوان مبنا (JSON)")
+    parser.add_argument("--compare", help="مقایسه با مبنای ذخیره‌شده (JSON)")
+    parser.add_argument("--write-sample", help="فقط یک فایل نمونه xlsx/csv بساز")
+    parser.add_argument("--rows", type=int, default=1000, help="تعداد ردیف فایل نمونه")
+    args = parser.parse_args(argv)
+
+    if args.write_sample:
+        df = generate_tankhah(args.rows, args.seed)
+        if args.write_sample.lower().endswith(".csv"):
+            df.to_csv(args.write_sample, index=False, encoding="utf-8-sig")
+        else:
+            df.to_excel(args.write_sample, index=False)
+        return 0
+
+    results = run_bench(args.sizes, args.scenarios, args.seed, args.with_io, not args.no_memory, args.workers)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\nمقایسه با مبنا:")
+        for key, r in results.items():
+            if key in baseline:
+                print(format_result(key, r, baseline[key]))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
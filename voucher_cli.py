@@ -0,0 +1,207 @@
+"""
+اجرای دسته‌ای ساخت سند برای یک پوشه از فایل‌های تنخواه (xlsx یا csv).
+
+نمونه:
+    python voucher_cli.py ورودی/ -o خروجی/ --tanakh-number 12 --tanakh-name "اقای حقی" \
+        --date 1403/03/12 --project تهران --sath4 5021 --sath5 7
+
+اگر سربرگ هر فایل متفاوت است، با --headers یک CSV بدهید که ستون file (نام
+فایل) و هر کدام از فیلدهای سربرگ را دارد؛ مقادیر آن روی مقادیر خط فرمان
+می‌نشیند.
+
+برای فایل‌های خیلی بزرگ با --stream هر فایل تکه‌تکه خوانده و سند مستقیم
+روی دیسک نوشته می‌شود تا حافظه مستقل از اندازه فایل بماند.
+"""
+import argparse
+import csv
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import pandas as pd
+
+from voucher_engine import HEADER_FIELDS, STREAM_CHUNK_ROWS, TEMPLATE_PATH, process_file, stream_file
+from voucher_metrics import JobMetrics, setup_metrics_logging
+from voucher_store import STORE_PATH, get_store
+
+OUTPUT_SUFFIX = "_سند"
+SUMMARY_NAME = "summary.csv"
+INPUT_SUFFIXES = (".xlsx", ".csv")
+
+
+def load_header_table(path):
+    """خواندن CSV سربرگ‌ها به صورت {نام فایل: {فیلد: مقدار}}."""
+    table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    if "file" not in table.columns:
+        raise ValueError("ستون file در فایل سربرگ‌ها وجود ندارد")
+    fields = [c for c in table.columns if c in HEADER_FIELDS]
+    return {
+        str(rec["file"]).strip(): {f: rec[f] for f in fields if rec[f].strip()}
+        for rec in table.to_dict("records")
+    }
+
+
+def output_name(name):
+    """نام فایل سند خروجی برای یک فایل ورودی."""
+    return f"{Path(name).stem}{OUTPUT_SUFFIX}.xlsx"
+
+
+def run_job(src, header, template_path=TEMPLATE_PATH, name=None, out_path=None, chunk_rows=STREAM_CHUNK_ROWS,
+            store_path=STORE_PATH, progress=None, workers=1, track_memory=None, preview=None):
+    """
+    پردازش یک فایل با زمان‌سنجی مراحل؛ خروجی (بایت‌ها، تعداد سطر، معیارها).
+
+    با out_path فایل در حالت جریانی پردازش و سند مستقیم در out_path نوشته
+    می‌شود؛ آنگاه بایت‌ها None است. store_path حافظه ماندگار کد معین
+    (voucher_store) است؛ None یعنی فقط قوانین. progress پس از هر تکه
+    chunk_rows ردیفی صدا زده می‌شود (voucher_engine.Progress). با workers
+    بیش از یک، فایل بزرگ (غیرجریانی) روی چند پروسه ساخته می‌شود.
+    track_memory حافظه اوج هر مرحله را هم می‌سنجد (None: از محیط، JobMetrics).
+    با فهرست preview (فقط حالت غیرجریانی) پیش‌نمایش سند به آن اضافه می‌شود.
+    """
+    metrics = JobMetrics(name, track_memory)
+    store = get_store(store_path) if store_path else None
+    if out_path is not None:
+        try:
+            n_lines = stream_file(src, header, out_path, template_path, name, chunk_rows, metrics, store, progress)
+            data = None
+        except Exception:
+            # سند نیمه‌کاره روی دیسک نماند
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            raise
+    else:
+        data, n_lines = process_file(src, header, template_path, name, metrics, store, progress, chunk_rows,
+                                     workers, preview)
+    metrics.log()
+    return data, n_lines, metrics.as_dict()
+
+
+def process_batch(jobs, max_workers=None, template_path=TEMPLATE_PATH, on_done=None,
+                  stream_dir=None, chunk_rows=STREAM_CHUNK_ROWS, store_path=STORE_PATH, file_workers=1,
+                  track_memory=None):
+    """
+    پردازش هم‌زمان چند فایل در یک process pool.
+
+    jobs فهرست (نام فایل، مسیر یا BytesIO، سربرگ) است. خروجی به همان ترتیب
+    jobs فهرستی از دیکشنری {file, output, status, lines, data, metrics, error} است؛
+    خطای یک فایل بقیه را متوقف نمی‌کند. on_done(result) بعد از هر فایل صدا
+    زده می‌شود. با stream_dir هر سند در حالت جریانی مستقیم در آن پوشه
+    نوشته می‌شود و data خالی (None) می‌ماند. file_workers تعداد پروسه‌های
+    ساخت هر فایل بزرگ است (voucher_engine.build_voucher_parallel).
+    """
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_job, src, header, template_path, name,
+                        os.path.join(stream_dir, output_name(name)) if stream_dir else None,
+                        chunk_rows, store_path, None, file_workers, track_memory): i
+            for i, (name, src, header) in enumerate(jobs)
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            name = jobs[i][0]
+            result = {"file": name, "output": output_name(name), "status": "ok",
+                      "lines": 0, "data": None, "metrics": None, "error": ""}
+            try:
+                result["data"], result["lines"], result["metrics"] = fut.result()
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = str(e)
+            results[i] = result
+            if on_done is not None:
+                on_done(result)
+    return results
+
+
+def batch_summary_csv(results):
+    """خلاصه وضعیت هر فایل به صورت CSV."""
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["file", "output", "status", "lines", "error"])
+    for r in results:
+        writer.writerow([r["file"], r["output"] if r["status"] == "ok" else "",
+                         r["status"], r["lines"], r["error"]])
+    return out.getvalue().encode("utf-8-sig")
+
+
+def batch_zip(results):
+    """همه سندهای ساخته‌شده به همراه summary.csv در یک فایل ZIP."""
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for r in results:
+            if r["status"] == "ok":
+                zf.writestr(r["output"], r["data"])
+        zf.writestr(SUMMARY_NAME, batch_summary_csv(results))
+    return buf.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ساخت دسته‌ای سند حسابداری تنخواه")
+    parser.add_argument("input_dir", help="پوشه فایل‌های تنخواه (xlsx/csv)")
+    parser.add_argument("-o", "--output-dir", default="vouchers")
+    parser.add_argument("--template", default=TEMPLATE_PATH)
+    parser.add_argument("--headers", help="CSV سربرگ هر فایل (ستون file + فیلدهای سربرگ)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--metrics", action="store_true", help="زمان مراحل هر فایل را به صورت JSON روی stderr بنویس")
+    parser.add_argument("--track-memory", action="store_true", default=None,
+                        help="حافظه اوج هر مرحله را هم با tracemalloc بسنج (کندتر؛ مثل TANKHAH_TRACK_MEMORY=1)")
+    parser.add_argument("--file-workers", type=int, default=1,
+                        help="تعداد پروسه‌های ساخت هر فایل بزرگ (برای یک فایل خیلی بزرگ روی سرور چندهسته‌ای)")
+    parser.add_argument("--stream", action="store_true", help="حالت جریانی با حافظه ثابت برای فایل‌های خیلی بزرگ")
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS, help="تعداد ردیف هر تکه در حالت جریانی")
+    parser.add_argument("--store", default=STORE_PATH, help="فایل SQLite اصلاح‌های دستی و حافظه کد معین")
+    parser.add_argument("--no-store", action="store_true", help="کد معین فقط از روی قوانین")
+    parser.add_argument("--tanakh-number", dest="tanakh_number", default="")
+    parser.add_argument("--tanakh-name", dest="tanakh_name", default="")
+    parser.add_argument("--date", dest="date_input", default="")
+    parser.add_argument("--project", dest="project_name", default="")
+    parser.add_argument("--sath4", dest="sath4_default", default="")
+    parser.add_argument("--sath5", dest="sath5_default", default="")
+    parser.add_argument("--sath4-fee", dest="sath4_fee_input", default="")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        setup_metrics_logging()
+
+    base_header = {f: getattr(args, f) for f in HEADER_FIELDS}
+    per_file = load_header_table(args.headers) if args.headers else {}
+
+    inputs = sorted(
+        p for p in Path(args.input_dir).iterdir()
+        if p.suffix.lower() in INPUT_SUFFIXES
+        and not p.name.startswith("~$") and not p.stem.endswith(OUTPUT_SUFFIX)
+    )
+    if not inputs:
+        print(f"هیچ فایل xlsx/csv در {args.input_dir} پیدا نشد", file=sys.stderr)
+        return 1
+
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def report(result):
+        if result["status"] == "ok":
+            if result["data"] is not None:
+                (out_dir / result["output"]).write_bytes(result["data"])
+                result["data"] = None
+            print(f"✅ {result['file']}: {result['lines']} سطر")
+        else:
+            print(f"❌ {result['file']}: {result['error']}", file=sys.stderr)
+
+    jobs = [(src.name, str(src), {**base_header, **per_file.get(src.name, {})}) for src in inputs]
+    results = process_batch(jobs, args.workers, args.template, on_done=report,
+                            stream_dir=str(out_dir) if args.stream else None, chunk_rows=args.chunk_rows,
+                            store_path=None if args.no_store else args.store, file_workers=args.file_workers,
+                            track_memory=args.track_memory)
+    (out_dir / SUMMARY_NAME).write_bytes(batch_summary_csv(results))
+
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"{len(inputs) - failed} از {len(inputs)} فایل پردازش شد")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+کلاینت سرویس HTTP ساخت سند (voucher_service).
+
+ServiceClient و RemoteJob همان رابط JobManager و Job را دارند، پس صفحه
+Streamlit بدون تغییر در نمایش وضعیت کارها می‌تواند کار را به‌جای پروسه‌های
+خودش به سرویس بفرستد (متغیر محیطی TANKHAH_SERVICE_URL).
+"""
+import json
+import threading
+from collections import OrderedDict
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+
+from voucher_jobs import CANCELLED, ERROR, FINISHED, KEEP_FINISHED, Job, QueueFull
+
+# مهلت هر درخواست (ثانیه)؛ فرستادن فایل بزرگ بیشتر طول می‌کشد
+REQUEST_TIMEOUT = 30
+UPLOAD_TIMEOUT = 300
+
+
+class ServiceError(Exception):
+    """پاسخ خطای سرویس (غیر از 429)."""
+
+
+class ServiceClient:
+    """
+    رابط JobManager (submit و get) روی سرویس HTTP.
+
+    کارهای فرستاده‌شده با کلیدشان نگه داشته می‌شوند تا اجرای دوباره صفحه
+    همان فایل را دوباره نفرستد.
+    """
+
+    def __init__(self, url, keep=KEEP_FINISHED):
+        self.url = url.rstrip("/")
+        self.keep = keep
+        self._by_key = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _request(self, method, path, query=None, data=None, timeout=REQUEST_TIMEOUT):
+        """
+        خروجی (کد وضعیت، بدنه)؛ 404 و 409 هم برگردانده می‌شوند. برای 429 خطای
+        QueueFull، برای 400 ValueError و برای بقیه خطاها ServiceError.
+        """
+        url = self.url + path + (f"?{urlencode(query, doseq=True)}" if query else "")
+        request = Request(url, data=data, method=method)
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            body = e.read()
+            if e.code == 429:
+                raise QueueFull() from None
+            if e.code in (404, 409):
+                return e.code, body
+            try:
+                message = json.loads(body)["error"]
+            except (ValueError, KeyError, TypeError):
+                message = body.decode("utf-8", "replace") or str(e)
+            raise (ValueError if e.code == 400 else ServiceError)(message) from None
+        except URLError as e:
+            raise ServiceError(f"سرویس ساخت سند در دسترس نیست: {e.reason}") from None
+
+    def _json(self, method, path, **kwargs):
+        status, body = self._request(method, path, **kwargs)
+        return status, json.loads(body)
+
+    def submit(self, key, name, data, header, workers=None):
+        """
+        فرستادن فایل به سرویس؛ خروجی RemoteJob.
+
+        تشخیص کار تکراری و تعداد پروسه‌های هر فایل (workers) با خود سرویس
+        است؛ key فقط برای شناختن کار در صفحه نگه داشته می‌شود.
+        """
+        with self._lock:
+            job = self._by_key.get(key)
+        if job is not None:
+            try:
+                if job.status not in (ERROR, CANCELLED):
+                    return job
+            except ServiceError:
+                pass  # سرویس دوباره راه‌اندازی شده و کار را نمی‌شناسد
+        _, state = self._json("POST", "/jobs", query={"name": name, **header}, data=data, timeout=UPLOAD_TIMEOUT)
+        job = RemoteJob(self, state["id"], key, name, state)
+        with self._lock:
+            self._by_key[key] = job
+            self._by_key.move_to_end(key)
+            while len(self._by_key) > self.keep:
+                self._by_key.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        status, state = self._json("GET", f"/jobs/{quote(job_id)}")
+        if status != 200:
+            return None
+        return RemoteJob(self, job_id, None, state["name"], state)
+
+    def health(self):
+        return self._json("GET", "/health")[1]
+
+
+class RemoteJob:
+    """یک کار روی سرویس؛ وضعیت در هر پرسش از سرویس خوانده و پس از پایان نگه داشته می‌شود."""
+
+    def __init__(self, client, job_id, key, name, state=None):
+        self.id = job_id
+        self.key = key
+        self.name = name
+        self._client = client
+        self._state = state
+        self._result = None
+        self._preview = None
+
+    def _fetch(self):
+        if self._state is None or self._state["status"] not in FINISHED:
+            status, state = self._client._json("GET", f"/jobs/{quote(self.id)}")
+            if status != 200:
+                raise ServiceError(f"کار {self.id} روی سرویس پیدا نشد")
+            self._state = state
+        return self._state
+
+    @property
+    def status(self):
+        return self._fetch()["status"]
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def progress(self):
+        """{status, rows, lines, total_rows, seconds} تا این لحظه."""
+        state = self._fetch()
+        return {k: state[k] for k in ("status", "rows", "lines", "total_rows", "seconds")}
+
+    def result(self):
+        """(بایت‌ها، تعداد سطر، معیارها) کار موفق."""
+        if self._result is None:
+            state = self._fetch()
+            status, data = self._client._request("GET", f"/jobs/{quote(self.id)}/result",
+                                                 timeout=UPLOAD_TIMEOUT)
+            if status != 200:
+                raise ServiceError(f"کار {self.id} هنوز نتیجه ندارد ({state['status']})")
+            self._result = (data, state["lines"], state.get("metrics"))
+        return self._result
+
+    def preview(self):
+        """پیش‌نمایش سند کار موفق؛ هر صفحه از سرویس خوانده می‌شود (RemotePreview)."""
+        if self._preview is None:
+            self._preview = RemotePreview(self._client, self.id)
+        return self._preview
+
+    @property
+    def error(self):
+        return self._fetch()["error"]
+
+    def cancel(self):
+        self._client._request("DELETE", f"/jobs/{quote(self.id)}")
+        self._state = None
+
+    # همان قالب نتیجه کار محلی (برای batch_zip)
+    as_result = Job.as_result
+
+
+class RemotePreview:
+    """
+    رابط VoucherPreview (accounts، areas، groups و view) روی سرویس.
+
+    پیش‌نمایش در پروسه کارگر سرویس مانده و هر view فقط جمع‌ها و سطرهای یک
+    صفحه را می‌آورد.
+    """
+
+    def __init__(self, client, job_id):
+        self._client = client
+        self._path = f"/jobs/{quote(job_id)}/preview"
+        first = self._get({})
+        self.accounts = first["accounts"]
+        self.areas = first["areas"]
+        self.groups = first["groups"]
+
+    def _get(self, query):
+        status, body = self._client._json("GET", self._path, query=query)
+        if status != 200:
+            raise ServiceError(f"پیش‌نمایش کار روی سرویس نیست ({body.get('status') or body.get('error')})")
+        return body
+
+    def view(self, accounts=(), areas=(), group=0, number=1):
+        """همان خروجی VoucherPreview.view با جدول‌های pandas."""
+        import pandas as pd
+
+        body = self._get({"account": list(accounts), "area": list(areas), "group": group, "page": number})
+        return {
+            "lines": body["lines"],
+            "pages": body["pages"],
+            "totals": pd.DataFrame(**body["totals"]).rename_axis("account"),
+            "page": pd.DataFrame(**body["page"]),
+        }
@@ -0,0 +1,386 @@
+"""
+مقایسه سلول‌به‌سلول خروجی موتور ساخت سند با پیاده‌سازی مرجع.
+
+هر نسخه سریع‌تر حلقه (برداری، تکه‌تکه یا موازی) باید دقیقاً همان سندی را
+بسازد که voucher_reference می‌سازد. این ابزار هر دو را روی داده مصنوعی
+(همه سناریوهای voucher_bench با چند seed) و فایل‌های واقعی اجرا می‌کند و
+سلول‌های متفاوت را گزارش می‌دهد.
+
+نمونه:
+    python voucher_diff.py
+    python voucher_diff.py --engine voucher_engine:build_voucher --sizes 500 5000 --seeds 0 1 2
+    python voucher_diff.py --edits 20          # هر حالت ویرایش ردیف‌ها در برابر build_voucher
+
+داده مصنوعی با حافظه کد معین (voucher_store) هم یک بار برای یادگیری و یک بار
+از حافظه ساخته می‌شود و تقدم اصلاح دستی و کنار گذاشتن نتیجه‌های نسخه قبلی
+قوانین هم بررسی می‌شود.
+    python voucher_diff.py تنخواه۱.xlsx تنخواه۲.xlsx --tanakh-number 12 --tanakh-name "اقای حقی" \
+        --date 1403/03/12 --project تهران --sath4 5021 --sath5 7
+    python voucher_diff.py تنخواه.xlsx --normalized --tanakh-name "آقای الماسی" ...
+
+موتور نام‌ها و شرح‌ها را پیش از مقایسه یکسان می‌کند (voucher_text) ولی مرجع
+متن خام را؛ پس داده مصنوعی یک بار هم با شکل‌های دیگر متن (voucher_bench.
+text_variants و VARIANT_HEADERS) به موتور داده و با مرجع روی متن پایه
+مقایسه می‌شود. فایل واقعی‌ای که نام یا شرح‌هایش شکل دیگر دارد با
+--normalized بررسی شود.
+"""
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import voucher_reference
+from voucher_bench import SCENARIOS, VARIANT_HEADERS, generate_tankhah, text_variants
+from voucher_cli import load_header_table
+from voucher_engine import (
+    HEADER_FIELDS, LINE_COLUMNS, LINE_FIELDS, VoucherLine, build_voucher, build_voucher_parallel,
+    classify_descriptions, detect_account_code, get_rules, iter_voucher_lines, read_tankhah,
+)
+from voucher_edit import VoucherEditor
+from voucher_reference import build_voucher_reference
+from voucher_store import AccountStore
+from voucher_text import name_key, normalize_text
+
+DEFAULT_ENGINE = "voucher_engine:build_voucher"
+DEFAULT_SIZES = (300, 3000)
+DEFAULT_SEEDS = (0, 1, 2)
+
+
+def load_engine(spec):
+    """موتور را از «ماژول:تابع» می‌سازد؛ تابع باید (df, header) بگیرد و VoucherLine برگرداند."""
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name or "build_voucher")
+
+
+def chunked_engine(chunk_rows):
+    """موتوری که دیتافریم را chunk_rows ردیف به ردیف به iter_voucher_lines می‌دهد."""
+    def engine(df, header):
+        frames = (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+        return list(iter_voucher_lines(frames, header))
+    return engine
+
+
+def parallel_engine(workers):
+    """موتوری که هر فایل را با build_voucher_parallel روی workers پروسه می‌سازد."""
+    def engine(df, header):
+        return [VoucherLine.from_values(values) for values in build_voucher_parallel(df, header, workers)]
+    return engine
+
+
+def edit_states(df, n_edits, seed=0):
+    """
+    ویرایش‌های پشت‌سرهم آزمون به شکل edited_rows: n_edits سلول تصادفی با مقدار
+    ردیف دیگری از همان ستون (هر پنجمی None در یک سلول خالی NaN، که موتور
+    «None» می‌نویسد نه «nan»)، سپس نیمی از آن‌ها و در پایان هیچ (بازگشت به df
+    اصلی).
+    """
+    rng = np.random.default_rng(seed)
+    empty = np.argwhere(df.isna().to_numpy())
+    edits = {}
+    for k, (row, other, j) in enumerate(zip(rng.integers(len(df), size=n_edits),
+                                            rng.integers(len(df), size=n_edits),
+                                            rng.integers(len(df.columns), size=n_edits))):
+        if k % 5 == 4 and len(empty):
+            row, j = empty[rng.integers(len(empty))]
+            edits.setdefault(int(row), {})[df.columns[j]] = None
+        else:
+            edits.setdefault(int(row), {})[df.columns[j]] = df.iat[other, j]
+    return [edits, dict(list(edits.items())[::2]), {}]
+
+
+def check_edits(df, header, n_edits, seed=0, source=None):
+    """
+    ساخت سند با VoucherEditor و ویرایش‌های edit_states.
+
+    سند هر حالت (پیش از ویرایش و پس از هر apply) با build_voucher روی همان
+    ردیف‌های ویرایش‌شده مقایسه می‌شود و سند پایانی با مرجع روی source (پیش‌فرض
+    df). ستون اختلاف‌های حالت‌های میانی «ستون@شماره حالت» است.
+    """
+    editor = VoucherEditor(df, header)
+    n_cells, mismatches = 0, []
+    for step, edits in enumerate([None, *edit_states(editor.base, n_edits, seed)]):
+        if edits is not None:
+            editor.apply(edits)
+        expected = line_cells(build_voucher(editor.df, header))
+        n_cells += len(expected)
+        mismatches += [(row, f"{col}@{step}", exp, act)
+                       for row, col, exp, act in diff_cells(expected, line_cells(editor.lines))]
+    expected = reference_cells(build_voucher_reference(df if source is None else source, header))
+    return n_cells + len(expected), mismatches + diff_cells(expected, line_cells(editor.lines))
+
+
+def store_engine(store):
+    """موتوری که build_voucher را با حافظه کد معین store اجرا می‌کند."""
+    def engine(df, header):
+        return build_voucher(df, header, store=store)
+    return engine
+
+
+def check_store():
+    """
+    آزمون حافظه کد معین روی یک پایگاه موقت؛ خروجی فهرست (نام مورد, پیام خطا یا None).
+
+    اصلاح دستی باید بر نتیجه یادگرفته مقدم باشد و نتیجه‌های یک نسخه قوانین
+    فقط وقتی نسخه عوض شود حذف شوند.
+    """
+    rules = get_rules()
+    desc, sath5, name = "شرح آزمون حافظه", "006007", "اقای حقی"
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AccountStore(os.path.join(tmp, "accounts.sqlite3"))
+
+        def code():
+            return classify_descriptions([desc], sath5, name, rules, store)[0]
+
+        def known(version):
+            return desc in store.lookup([desc], False, False, version)
+
+        store.remember({desc: 7001}, False, False, rules.version)
+        results.append(("store/learned", None if code() == 7001 else f"کد {code()} به جای 7001"))
+        store.set_override(desc, 7002)
+        results.append(("store/override", None if code() == 7002 else f"کد {code()} به جای 7002 (اصلاح دستی)"))
+        store.remove_override(desc)
+
+        store.remember({"شرح دیگر": 7003}, False, False, rules.version)
+        results.append(("store/same-version", None if known(rules.version) else "نتیجه همان نسخه حذف شد"))
+        store.remember({"شرح دیگر": 7003}, False, False, "other-version")
+        results.append(("store/new-version", "نتیجه نسخه قبلی حذف نشد" if known(rules.version) else None))
+    return results
+
+
+# ------------------------------------------------------------
+# یکسان‌سازی متن (voucher_text)
+# ------------------------------------------------------------
+# نام‌هایی که مرجع با متن دقیق می‌شناسد (سطح چهارم تنخواه‌دار، استثناء عطا/زابلی، الماسی)
+REFERENCE_NAMES = {name_key(name): name for name in
+                   [*voucher_reference.tanakh_sath4_map, "اقا عطا", "خانم زابلی", "اقای الماسی"]}
+
+# ستون‌هایی که موتور پیش از جست‌وجوی کلیدواژه یکسان می‌کند
+NORMALIZED_COLUMNS = ("شرح سند", "نام فروشنده / فروشگاه")
+
+# کد معین مورد انتظار شکل‌های دیگر متن: (شرح، سطح پنجم، نام) پایه و شکل دیگر آن
+NORMALIZATION_CASES = (
+    (("خرید لوازم التحریر", "006003", "اقای حقی"), ("خريد لوازم‌التحرير", "006003", "اقاي حقي")),
+    (("کرایه حمل مصالح", "000007", "اقای حقی"), ("كرايه حمل مصالح", "000007", "اقای حقی")),
+    (("تست آزمایشگاه بتن", "006003", "اقای حقی"), ("تست‌آزمایشگاه‌بتن", "006003", "اقای حقی")),
+    (("ارسال مدارک", "000007", "اقا عطا"), ("ارسال مدارك", "000007", "آقا عطا")),
+    (("اوردن بار", "006003", "خانم زابلی"), ("اوردن بار", "006003", " خانم  زابلي ")),
+    (("پرینت 20 برگ نقشه", "006003", "اقای حقی"), ("پـرینت ۲۰ برگ نقشه", "006003", "اقای حقی")),
+    (("بنزین خودرو", "000007", "آقای ویسی"), ("بنزين خودرو", "000007", "اقای ویسی")),
+)
+
+
+def canonical_input(df, header):
+    """
+    ورودی مرجع در حالت یکسان‌سازی: نام تنخواه‌دار به همان شکل جدول‌های مرجع،
+    نام پروژه و شرح‌ها و نام فروشنده‌ها یکسان‌شده (voucher_text)؛ مرجع با
+    آن همان تشخیصی را می‌دهد که موتور با متن خام.
+    """
+    df = df.rename(columns=lambda c: str(c).strip())
+    for col in NORMALIZED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(lambda v: normalize_text(v).strip() if isinstance(v, str) else v)
+    name = header["tanakh_name"]
+    project = name_key(header["project_name"])
+    header = {
+        **header,
+        "tanakh_name": REFERENCE_NAMES.get(name_key(name), normalize_text(name).strip()),
+        "project_name": "پرند" if project == "پرند" else normalize_text(header["project_name"]).strip(),
+    }
+    return df, header
+
+
+def normalized_cells(cells):
+    """سلول‌ها با متن یکسان‌شده (name_key)؛ شکل‌های دیگر یک متن یکی می‌شوند."""
+    return {key: name_key(value) if isinstance(value, str) else value for key, value in cells.items()}
+
+
+def check_variants(df, header, variant_df, variant_header, engine):
+    """
+    مرجع روی df و header پایه، موتور روی شکل دیگر متن آن‌ها؛ متن سلول‌ها
+    یکسان‌شده مقایسه می‌شود و کد معین، مبلغ و سطح‌ها دقیق.
+    """
+    expected = normalized_cells(reference_cells(build_voucher_reference(df, header)))
+    actual = normalized_cells(line_cells(engine(variant_df, variant_header)))
+    return len(expected), diff_cells(expected, actual)
+
+
+def check_account_codes():
+    """NORMALIZATION_CASES: کد موتور برای شکل دیگر = کد مرجع برای شکل پایه؛ خروجی فهرست اختلاف‌ها."""
+    problems = []
+    for base, variant in NORMALIZATION_CASES:
+        expected = voucher_reference.detect_account_code(*base)
+        actual = detect_account_code(*variant)
+        if actual != expected:
+            problems.append(f"{variant[0]!r} ({variant[2]!r}): {actual} به جای {expected}")
+    return problems
+
+
+def _cell_value(value):
+    # openpyxl رشته خالی را ذخیره نمی‌کند؛ پس "" و None یکی‌اند
+    if value is None or value == "":
+        return None
+    return value
+
+
+def reference_cells(ws):
+    """سلول‌های پرشده برگه مرجع (بدون سربرگ): {(سطر, ستون): مقدار}."""
+    cells = {}
+    for row in ws.iter_rows(min_row=2):
+        for cell in row:
+            value = _cell_value(cell.value)
+            if value is not None:
+                cells[(cell.row, cell.column_letter)] = value
+    return cells
+
+
+def line_cells(lines):
+    """سلول‌هایی که فهرست VoucherLine در قالب می‌نویسد: {(سطر, ستون): مقدار}."""
+    cells = {}
+    for row_index, line in enumerate(lines, start=2):
+        for field, value in zip(LINE_FIELDS, line.values()):
+            value = _cell_value(value)
+            if value is not None:
+                cells[(row_index, LINE_COLUMNS[field])] = value
+    return cells
+
+
+def diff_cells(expected, actual):
+    """فهرست (سطر, ستون, مقدار مرجع, مقدار موتور) برای سلول‌های متفاوت، به ترتیب سطر."""
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        exp, act = expected.get(key), actual.get(key)
+        if exp != act:
+            mismatches.append((key[0], key[1], exp, act))
+    return mismatches
+
+
+def check_frame(df, header, engine):
+    """اجرای مرجع و موتور روی یک دیتافریم؛ خروجی (تعداد سلول مرجع، اختلاف‌ها)."""
+    expected = reference_cells(build_voucher_reference(df, header))
+    actual = line_cells(engine(df, header))
+    return len(expected), diff_cells(expected, actual)
+
+
+def check_file(path, header, engine, normalized=False):
+    """
+    مثل check_frame ولی هر طرف فایل را با خواننده خودش می‌خواند. با normalized
+    مرجع ورودی یکسان‌شده (canonical_input) می‌گیرد و متن سلول‌ها یکسان‌شده
+    مقایسه می‌شود.
+    """
+    df = pd.read_excel(path)
+    if not normalized:
+        expected = reference_cells(build_voucher_reference(df, header))
+        actual = line_cells(engine(read_tankhah(path), header))
+        return len(expected), diff_cells(expected, actual)
+    expected = normalized_cells(reference_cells(build_voucher_reference(*canonical_input(df, header))))
+    actual = normalized_cells(line_cells(engine(read_tankhah(path), header)))
+    return len(expected), diff_cells(expected, actual)
+
+
+def report(name, n_cells, mismatches, limit):
+    if not mismatches:
+        print(f"✅ {name}: {n_cells} سلول یکسان")
+        return
+    print(f"❌ {name}: {len(mismatches)} سلول متفاوت از {n_cells}")
+    for row, col, exp, act in mismatches[:limit]:
+        print(f"    {col}{row}: مرجع={exp!r} موتور={act!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مقایسه خروجی موتور ساخت سند با پیاده‌سازی مرجع")
+    parser.add_argument("files", nargs="*", help="فایل‌های واقعی تنخواه (اختیاری)")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help="موتور مورد آزمون به شکل ماژول:تابع")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(DEFAULT_SEEDS))
+    parser.add_argument("--no-synthetic", action="store_true", help="فقط فایل‌های داده‌شده را بررسی کن")
+    parser.add_argument("--chunk-rows", type=int, help="آزمون ساخت تکه‌تکه با این تعداد ردیف (به جای --engine)")
+    parser.add_argument("--workers", type=int, help="آزمون ساخت موازی با این تعداد بازه (به جای --engine)")
+    parser.add_argument("--edits", type=int, help="آزمون ویرایش ردیف‌ها با این تعداد سلول (به جای --engine)")
+    parser.add_argument("--normalized", action="store_true",
+                        help="فایل‌ها: مرجع ورودی یکسان‌شده بگیرد و متن سلول‌ها یکسان‌شده مقایسه شود (voucher_text)")
+    parser.add_argument("--limit", type=int, default=10, help="حداکثر اختلاف چاپی برای هر مورد")
+    parser.add_argument("--headers", help="CSV سربرگ هر فایل (مثل voucher_cli)")
+    parser.add_argument("--tanakh-number", dest="tanakh_number", default="")
+    parser.add_argument("--tanakh-name", dest="tanakh_name", default="")
+    parser.add_argument("--date", dest="date_input", default="")
+    parser.add_argument("--project", dest="project_name", default="")
+    parser.add_argument("--sath4", dest="sath4_default", default="")
+    parser.add_argument("--sath5", dest="sath5_default", default="")
+    parser.add_argument("--sath4-fee", dest="sath4_fee_input", default="")
+    args = parser.parse_args(argv)
+
+    if args.chunk_rows:
+        engine = chunked_engine(args.chunk_rows)
+    elif args.workers:
+        engine = parallel_engine(args.workers)
+    else:
+        engine = load_engine(args.engine)
+
+    def check(df, header):
+        if args.edits:
+            return check_edits(df, header, args.edits)
+        return check_frame(df, header, engine)
+
+    failed = 0
+
+    if not args.no_synthetic:
+        for size in args.sizes:
+            for seed in args.seeds:
+                for messy in (False, True):
+                    df = generate_tankhah(size, seed, messy=messy)
+                    for name, header in SCENARIOS.items():
+                        case = f"{name}/{size}/seed={seed}{'/messy' if messy else ''}"
+                        n_cells, mismatches = check(df, header)
+                        report(case, n_cells, mismatches, args.limit)
+                        failed += bool(mismatches)
+            # شکل‌های دیگر متن (ي/ك، نیم‌فاصله، آ، ارقام فارسی) همان سند را می‌دهند
+            for seed in args.seeds:
+                base, variant = text_variants(generate_tankhah(size, seed), seed)
+                for name, header in SCENARIOS.items():
+                    n_cells, mismatches = check_variants(base, header, variant, {**header, **VARIANT_HEADERS[name]},
+                                                         engine)
+                    report(f"normalize/{name}/{size}/seed={seed}", n_cells, mismatches, args.limit)
+                    failed += bool(mismatches)
+        for problem in check_account_codes():
+            print(f"❌ normalize/account: {problem}")
+            failed += 1
+        with tempfile.TemporaryDirectory() as tmp:
+            engine_with_store = store_engine(AccountStore(os.path.join(tmp, "accounts.sqlite3")))
+            df = generate_tankhah(args.sizes[0], args.seeds[0], messy=True)
+            for run in ("learn", "recall"):
+                for name, header in SCENARIOS.items():
+                    n_cells, mismatches = check_frame(df, header, engine_with_store)
+                    report(f"store-{run}/{name}", n_cells, mismatches, args.limit)
+                    failed += bool(mismatches)
+        for case, problem in check_store():
+            print(f"❌ {case}: {problem}" if problem else f"✅ {case}")
+            failed += bool(problem)
+
+    base_header = {f: getattr(args, f) for f in HEADER_FIELDS}
+    per_file = load_header_table(args.headers) if args.headers else {}
+    for path in args.files:
+        name = path.replace("\\", "/").rsplit("/", 1)[-1]
+        header = {**base_header, **per_file.get(name, {})}
+        try:
+            if args.edits:
+                n_cells, mismatches = check_edits(read_tankhah(path), header, args.edits, source=pd.read_excel(path))
+            else:
+                n_cells, mismatches = check_file(path, header, engine, args.normalized)
+        except Exception as e:
+            print(f"❌ {path}: {e}")
+            failed += 1
+            continue
+        report(path, n_cells, mismatches, args.limit)
+        failed += bool(mismatches)
+
+    print("همه موارد یکسان است" if not failed else f"{failed} مورد اختلاف دارد")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
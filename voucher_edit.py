@@ -0,0 +1,179 @@
+"""
+ویرایش ردیف‌های تنخواه در صفحه و ساخت دوباره فقط سطرهای تغییرکرده سند.
+
+ردیف‌های ورودی در مرزهای امن (voucher_engine.safe_boundaries، همان مرزهای
+ساخت موازی) به بلوک‌های حدود EDIT_BLOCK_ROWS ردیفی تقسیم می‌شوند و سطرهای
+سند هر بلوک جدا نگه داشته می‌شود. با ویرایش یک ردیف فقط بلوک همان ردیف و
+بلوک بعدی (که سطر 1131 ناحیه/پرداخت جمعی بسته‌شده در مرز را دارد) دوباره
+ساخته می‌شود؛ بقیه سطرها همان‌اند. خروجی همیشه با build_voucher روی کل
+ردیف‌های ویرایش‌شده یکی است.
+
+نمونه:
+    editor = VoucherEditor(read_tankhah("تنخواه.xlsx"), header)
+    editor.apply({12: {"مبلغ": 250000}, 40: {"شرح سند": "خرید آب معدنی"}})
+    write_voucher(editor.lines)
+"""
+import time
+
+from voucher_engine import (
+    carry_before, check_header, get_rules, iter_voucher_lines, row_settlement_keys, run_start,
+    safe_boundaries,
+)
+
+# تعداد ردیف تقریبی هر بلوک؛ ویرایش یک ردیف حداکثر دو بلوک را دوباره می‌سازد
+EDIT_BLOCK_ROWS = 512
+
+# ستون‌هایی که مرز ناحیه/پرداخت جمعی را عوض می‌کنند
+KEY_COLUMNS = ("ناحیه", "پرداخت جمعی", "پرداخت گروهی")
+
+
+def _same(a, b):
+    """
+    برابری دو مقدار سلول همان‌طور که موتور می‌بیند: هم‌نوع و با متن (str) یکسان.
+
+    NaN با NaN برابر است ولی با None نه («nan» و «None»)؛ 1 با "1" هم برابر نیست.
+    """
+    return type(a) is type(b) and str(a) == str(b)
+
+
+class VoucherEditor:
+    """
+    سند یک فایل تنخواه که ردیف‌های ورودی آن ویرایش می‌شود.
+
+    base ردیف‌های اصلی و df ردیف‌های ویرایش‌شده است. apply ویرایش‌ها را به
+    شکل edited_rows در st.data_editor می‌گیرد ({شماره ردیف: {ستون: مقدار}})،
+    یعنی همه ویرایش‌ها نسبت به base؛ سلولی که از این دیکشنری حذف شود به
+    مقدار base برمی‌گردد. یک نسخه قوانین برای عمر ویرایشگر ثابت است.
+    """
+
+    def __init__(self, df, header, store=None, block_rows=EDIT_BLOCK_ROWS):
+        check_header(header)
+        self.header = dict(header)
+        self.store = store
+        self.block_rows = block_rows
+        self.rules = get_rules()
+        self.base = df.reset_index(drop=True)
+        self.df = self.base.copy()
+        self._edited = set()
+        self._keys = row_settlement_keys(self.df, self.header["tanakh_name"])
+        self._blocks = self._partition()
+        self._lines = {}
+        self._origins = {}
+        # با هر تغییر سند یکی زیاد می‌شود (برای کش پیش‌نمایش)
+        self.revision = 0
+        self.stats = {"rows": 0, "blocks": len(self._blocks), "recomputed": len(self._blocks),
+                      "seconds": self._build_all()}
+
+    # --------------------------------------------------------
+    # بلوک‌ها
+    # --------------------------------------------------------
+    def _partition(self):
+        """بلوک‌های (شروع، پایان) پشت‌سرهم در مرزهای امن نزدیک هر block_rows ردیف."""
+        n = len(self.df)
+        starts = safe_boundaries(self._keys, range(self.block_rows, n, self.block_rows))
+        return list(zip([0, *starts], [*starts, n]))
+
+    def _build_all(self):
+        """ساخت اولیه همه بلوک‌ها در یک گذر iter_voucher_lines."""
+        started = time.perf_counter()
+        lines = []
+        origins = []
+        bounds = []
+
+        def frames():
+            # iter_voucher_lines سطرهای هر تکه را پیش از گرفتن تکه بعدی yield می‌کند
+            for start, end in self._blocks:
+                bounds.append(len(lines))
+                yield self.df.iloc[start:end]
+
+        lines.extend(iter_voucher_lines(frames(), self.header, None, self.store, self.rules, origins=origins))
+        # سطرهای بستن آخرین دنباله مال آخرین بلوک است
+        bounds.append(len(lines))
+        for block, first, last in zip(self._blocks, bounds, bounds[1:]):
+            self._lines[block] = lines[first:last]
+            self._origins[block] = origins[first:last]
+        return time.perf_counter() - started
+
+    def _build_block(self, start, end):
+        """سطرها و ردیف مبدأ هر سطر (در کل df) برای یک بلوک."""
+        carry = carry_before(self.df, self._keys, start)
+        frame = self.df.iloc[start:end]
+        origins = []
+        lines = list(iter_voucher_lines([frame], self.header, None, self.store, self.rules, carry,
+                                        close_carry=end == len(self.df), origins=origins))
+        return lines, [start + row for row in origins]
+
+    # --------------------------------------------------------
+    # ویرایش
+    # --------------------------------------------------------
+    def _set(self, row, col, value):
+        """نوشتن یک سلول در df؛ خروجی True اگر مقدار عوض شد."""
+        j = self.df.columns.get_loc(col)
+        old = self.df.iat[row, j]
+        try:
+            self.df.iat[row, j] = value
+        except (TypeError, ValueError):
+            # مثلاً متن در ستون عددی: ستون مثل فایل‌های نامرتب object می‌شود
+            self.df[col] = self.df[col].astype(object)
+            self.df.iat[row, j] = value
+        return not _same(old, self.df.iat[row, j])
+
+    def apply(self, edits):
+        """
+        اعمال ویرایش‌ها و ساخت دوباره بلوک‌های تغییرکرده.
+
+        خروجی آمار {rows, blocks, recomputed, seconds}: ردیف‌های تغییرکرده،
+        تعداد کل بلوک‌ها، بلوک‌های دوباره ساخته‌شده و زمان.
+        """
+        started = time.perf_counter()
+        targets = {}
+        for cell in self._edited:
+            row, col = cell
+            targets[cell] = self.base.iat[row, self.base.columns.get_loc(col)]
+        for row, values in edits.items():
+            for col, value in values.items():
+                targets[(int(row), col)] = value
+        self._edited = {cell for cell, value in targets.items()
+                        if not _same(value, self.base.iat[cell[0], self.base.columns.get_loc(cell[1])])}
+
+        changed = {cell for cell, value in targets.items() if self._set(*cell, value)}
+        rows = {row for row, _ in changed}
+        if rows and any(str(col).strip() in KEY_COLUMNS for _, col in changed):
+            keys = self._keys.copy()
+            keys[sorted(rows)] = row_settlement_keys(self.df.iloc[sorted(rows)], self.header["tanakh_name"])
+            if not (keys == self._keys).all():
+                self._keys = keys
+                self._blocks = self._partition()
+
+        recomputed = 0
+        lines = {}
+        origins = {}
+        for start, end in self._blocks:
+            block = self._lines.get((start, end))
+            block_origins = self._origins.get((start, end))
+            # carry بلوک از دنباله‌ای می‌آید که پیش از آن بسته می‌شود؛ ردیف قبل از
+            # آن دنباله هم (اگر ناحیه/گروهش عوض شده) شروع دنباله را جابه‌جا می‌کند
+            first = run_start(self._keys, start)
+            first = first - 1 if first < start else start
+            if block is None or any(first <= row < end for row in rows):
+                block, block_origins = self._build_block(start, end)
+                recomputed += 1
+            lines[(start, end)] = block
+            origins[(start, end)] = block_origins
+        self._lines = lines
+        self._origins = origins
+        if recomputed:
+            self.revision += 1
+        self.stats = {"rows": len(rows), "blocks": len(self._blocks), "recomputed": recomputed,
+                      "seconds": time.perf_counter() - started}
+        return self.stats
+
+    @property
+    def lines(self):
+        """همه سطرهای سند (VoucherLine) به ترتیب."""
+        return [line for block in self._blocks for line in self._lines[block]]
+
+    @property
+    def origins(self):
+        """شماره ردیف df که هر سطر lines از آن آمده (iter_voucher_lines)."""
+        return [row for block in self._blocks for row in self._origins[block]]
@@ -0,0 +1,1493 @@
+"""
+موتور ساخت سند حسابداری تنخواه.
+
+این ماژول هیچ وابستگی‌ای به Streamlit ندارد تا هم از صفحه (app.py) و هم از
+خط فرمان (voucher_cli.py) قابل استفاده باشد.
+"""
+import hashlib
+import importlib.util
+import json
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from copy import copy
+from functools import lru_cache
+from itertools import islice
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from pandas.io.parsers import TextParser
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.utils import column_index_from_string
+
+from voucher_text import TEXT_NORMALIZATION_VERSION, name_key, normalize_text
+
+TEMPLATE_PATH = "سند حسابداری (21).xlsx"
+
+# فیلدهای سربرگ؛ همه به جز sath4_fee_input اجباری هستند
+HEADER_FIELDS = (
+    "tanakh_number",
+    "tanakh_name",
+    "date_input",
+    "project_name",
+    "sath4_default",
+    "sath5_default",
+    "sath4_fee_input",
+)
+REQUIRED_HEADER_FIELDS = HEADER_FIELDS[:-1]
+
+# ------------------------------------------------------------
+# جدول‌های قوانین (فایل rules.json)
+# ------------------------------------------------------------
+# جدول‌ها بیرون از کد نگه داشته می‌شوند تا افزودن تنخواه‌دار یا کلیدواژه
+# نیاز به استقرار دوباره نداشته باشد؛ فایل با عوض شدن mtime دوباره خوانده می‌شود.
+RULES_PATH = "rules.json"
+
+# جدول‌های فایل قوانین و معنی هر کدام
+RULE_TABLES = {
+    "tanakh_sath4_map": "سطح چهارم پرداخت هر تنخواه‌دار (حساب تنخواه اشخاص)",
+    "keywords_72": "کلیدواژه‌های هزینه‌های عمومی (گروه 72) به ترتیب اولویت؛ برای دفتر مرکزی فقط همین جدول",
+    "keywords_all": "کلیدواژه‌های هزینه پروژه؛ برای پروژه‌ها این جدول و بعد از آن keywords_72",
+    "exception_holders": "تنخواه‌دارهای دفتر مرکزی (سطح پنجم 006003) با استثناء ارسال/آوردن",
+    "exception_words": "کلماتی که برای exception_holders ایاب و ذهاب (7216) حساب می‌شوند",
+    "item_type_dict": "کالا/خدمت هر کد معین برای ستون AQ",
+    "keyword_accounts": "مپ کلمات به کد معین (پشتیبان؛ در تشخیص استفاده نمی‌شود)",
+}
+
+# اندازه حافظه نتیجه تشخیص برای شرح‌های تکراری
+CLASSIFY_CACHE_SIZE = 8192
+
+# ستون‌های مالیاتی که روی اولین سطر هر ردیف ورودی نوشته می‌شوند
+TAX_COLUMNS = ("AO", "AP", "AQ", "AR", "AS", "AT", "AU")
+
+# ------------------------------------------------------------
+# مدل سطر سند
+# ------------------------------------------------------------
+# فیلدهای مالیاتی به ترتیب ستون‌های AO تا AU
+TAX_FIELDS = ("tax_status", "deal_type", "item_kind", "trade_type", "party_code", "tax_amount", "duty_amount")
+LINE_FIELDS = ("date", "summary", "account", "description", "debit", "credit", "sath4", "sath5") + TAX_FIELDS
+# ستون قالب برای هر فیلد
+LINE_COLUMNS = dict(zip(LINE_FIELDS, ("C", "D", "H", "K", "P", "Q", "X", "Y") + TAX_COLUMNS))
+
+
+class VoucherLine:
+    """یک سطر سند، مستقل از برگه اکسل؛ هر فیلد یکی از ستون‌های LINE_COLUMNS است."""
+
+    __slots__ = LINE_FIELDS
+
+    def __init__(self, date=None, summary=None, account=None, description=None,
+                 debit=None, credit=None, sath4=None, sath5=None):
+        self.date = date
+        self.summary = summary
+        self.account = account
+        self.description = description
+        self.debit = debit
+        self.credit = credit
+        self.sath4 = sath4
+        self.sath5 = sath5
+        self.tax_status = self.deal_type = self.item_kind = self.trade_type = None
+        self.party_code = self.tax_amount = self.duty_amount = None
+
+    def values(self):
+        """مقادیر فیلدها به ترتیب LINE_FIELDS."""
+        return [getattr(self, f) for f in LINE_FIELDS]
+
+    @classmethod
+    def from_values(cls, values):
+        """عکس values()."""
+        line = cls.__new__(cls)
+        for field, value in zip(LINE_FIELDS, values):
+            setattr(line, field, value)
+        return line
+
+    def __eq__(self, other):
+        if not isinstance(other, VoucherLine):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self):
+        return f"VoucherLine({self.account}, debit={self.debit}, credit={self.credit}, {self.description!r})"
+
+
+class Rules:
+    """
+    جدول‌های قوانین کامپایل‌شده برای جست‌وجوی سریع.
+
+    هر بار خواندن فایل یک شیء تازه می‌سازد و خود شیء (نه محتوایش) کلید
+    حافظه تشخیص کد است، پس نتیجه قوانین قدیمی هیچ‌وقت با قوانین جدید
+    قاطی نمی‌شود. نام تنخواه‌دارها با name_key و کلیدواژه‌ها با
+    normalize_text (voucher_text) نگه داشته می‌شوند، پس شکل‌های مختلف یک
+    نام یا کلمه یکی پیدا می‌شوند.
+    """
+
+    __slots__ = ("tanakh_sath4", "office_keywords", "project_keywords",
+                 "exception_holders", "exception_words", "item_types", "version")
+
+    def __init__(self, tables):
+        missing = [name for name in RULE_TABLES if name not in tables]
+        if missing:
+            raise ValueError(f"جدول‌های قوانین ناقص است: {', '.join(missing)}")
+        self.tanakh_sath4 = {name_key(k): str(v) for k, v in tables["tanakh_sath4_map"].items()}
+        self.office_keywords = compile_keywords(tables["keywords_72"])
+        self.project_keywords = compile_keywords(tables["keywords_all"], tables["keywords_72"])
+        self.exception_holders = frozenset(map(name_key, tables["exception_holders"]))
+        self.exception_words = tuple(map(normalize_text, tables["exception_words"]))
+        self.item_types = {int(k): v for k, v in tables["item_type_dict"].items()}
+        # نسخه یکسان‌سازی متن هم جزو نسخه است: نتیجه‌های ذخیره‌شده به آن بستگی دارند
+        payload = json.dumps([tables[name] for name in RULE_TABLES] + [TEXT_NORMALIZATION_VERSION],
+                             ensure_ascii=False)
+        self.version = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_rules(rules_path=RULES_PATH):
+    """خواندن و کامپایل فایل قوانین."""
+    with open(rules_path, encoding="utf-8") as f:
+        try:
+            tables = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"فایل قوانین {rules_path} نامعتبر است: {e}") from e
+    return Rules(tables)
+
+
+# قوانین خوانده‌شده برای هر مسیر: {مسیر: (mtime_ns, قوانین)}؛ بین همه نشست‌های پروسه مشترک است
+_rules_cache = {}
+_rules_lock = threading.Lock()
+
+
+def get_rules(rules_path=RULES_PATH):
+    """
+    قوانین کامپایل‌شده از حافظه؛ فقط وقتی فایل قوانین عوض شده باشد (mtime)
+    دوباره خوانده می‌شود.
+    """
+    path = os.path.abspath(rules_path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _rules_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _rules_lock:
+        cached = _rules_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            if cached is not None:
+                # نتیجه‌های قوانین قبلی دیگر استفاده نمی‌شوند
+                _classify.cache_clear()
+            cached = (mtime, load_rules(path))
+            _rules_cache[path] = cached
+    return cached[1]
+
+
+def rules_version(rules_path=RULES_PATH):
+    """نسخه فعال جدول‌های قوانین (برای کلید کش نتیجه‌ها)."""
+    return get_rules(rules_path).version
+
+
+# ------------------------------------------------------------
+# Utility helpers
+# ------------------------------------------------------------
+def extract_int_str(val):
+    """عدد صحیح بدون اعشار؛ چندتایی '2532-2534' هم پشتیبانی."""
+    try:
+        if pd.isna(val):
+            return ""
+        s = str(val).strip()
+        if s == "" or s.lower() in ("nan", "none", "-"):
+            return ""
+        if "-" in s:
+            parts = []
+            for p in s.split("-"):
+                p = p.strip()
+                if p == "":
+                    continue
+                try:
+                    parts.append(str(int(float(p))))
+                except Exception:
+                    pass
+            return "-".join(parts) if parts else ""
+        return str(int(float(s)))
+    except Exception:
+        return ""
+
+
+def get_center_cost_str(val):
+    """سطح چهارم از 'مرکز هزینه' با صفر پَد ۶ رقمی."""
+    try:
+        if pd.isna(val):
+            return ""
+        s = str(val).strip()
+        if s == "" or s.lower() in ("nan", "none", "-"):
+            return ""
+        try:
+            s = str(int(float(s)))
+        except Exception:
+            s_digits = "".join(ch for ch in s if ch.isdigit())
+            if s_digits:
+                s = s_digits
+        return s.zfill(6)
+    except Exception:
+        return ""
+
+
+def clean_number(val):
+    """تبدیل عددی امن؛ خالی => 0."""
+    try:
+        if pd.isna(val):
+            return 0
+        s = str(val).strip()
+        if s == "" or s.lower() == "nan" or s == "-":
+            return 0
+        return float(s.replace(",", ""))
+    except Exception:
+        return 0
+
+
+def compile_keywords(*tables):
+    """
+    ادغام جدول‌های کلیدواژه به یک تاپل (کلمه، کد) با همان ترتیب اولویت.
+
+    مثل {**a, **b}: کلمه تکراری جای خود در جدول اول را نگه می‌دارد ولی
+    کدش از جدول بعدی می‌آید. کلمه‌ها با normalize_text یکسان می‌شوند تا با
+    شرح یکسان‌شده مقایسه شوند.
+    """
+    merged = {}
+    for table in tables:
+        merged.update((normalize_text(word), code) for word, code in table.items())
+    return tuple(merged.items())
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def _classify(text, is_office, is_exception_holder, rules):
+    """
+    تشخیص کد معین برای شرح غیرخالی یکسان‌شده (normalize_text)؛ نتیجه برای
+    همه شکل‌های یک شرح یک بار حساب می‌شود و در حافظه می‌ماند.
+    """
+    if is_exception_holder and any(word in text for word in rules.exception_words):
+        return 7216
+
+    keywords = rules.office_keywords if is_office else rules.project_keywords
+    for word, code in keywords:
+        if word in text:
+            return code
+    return 7296 if is_office else 7350  # پیش‌فرض دفتر / پروژه
+
+
+def detect_account_code(desc, sath5_val, tanakh_name, rules=None, store=None):
+    """
+    انتخاب کد معین بر اساس شرح، وضعیت دفتر/پروژه، و استثناء عطا/زابلی.
+
+    با store (voucher_store.AccountStore) اول اصلاح دستی و نتیجه ماندگار آن
+    شرح بررسی می‌شود.
+    """
+    if store is not None:
+        return classify_descriptions([desc], sath5_val, tanakh_name, rules, store)[0]
+    is_office = sath5_val == "006003"  # دفتر مرکزی
+    if not desc or desc.strip() == "":
+        return 7296 if is_office else 7350
+    rules = rules or get_rules()
+    return _classify(normalize_text(desc), is_office, name_key(tanakh_name) in rules.exception_holders, rules)
+
+
+def classify_descriptions(descs, sath5_val, tanakh_name, rules=None, store=None, stats=None):
+    """
+    کد معین فهرستی از شرح‌های متمایز، به همان ترتیب.
+
+    با store همه شرح‌ها یک‌جا در حافظه ماندگار جست‌وجو می‌شوند (اصلاح دستی،
+    سپس نتیجه قبلی همین نسخه قوانین) و فقط بقیه با کلیدواژه‌ها تشخیص داده و
+    برای دفعه بعد ثبت می‌شوند. stats (دیکشنری) تعداد یافته‌های هر منبع را
+    جمع می‌زند.
+    """
+    rules = rules or get_rules()
+    if store is None:
+        return [detect_account_code(desc, sath5_val, tanakh_name, rules) for desc in descs]
+    is_office = sath5_val == "006003"
+    is_exception_holder = name_key(tanakh_name) in rules.exception_holders
+    found = store.lookup([desc for desc in descs if desc and desc.strip()],
+                         is_office, is_exception_holder, rules.version)
+    codes, learned = [], {}
+    for desc in descs:
+        hit = found.get(desc)
+        if hit is not None:
+            codes.append(hit[0])
+            if stats is not None:
+                stats[hit[1]] = stats.get(hit[1], 0) + 1
+            continue
+        code = detect_account_code(desc, sath5_val, tanakh_name, rules)
+        codes.append(code)
+        if desc and desc.strip():
+            learned[desc] = code
+    store.remember(learned, is_office, is_exception_holder, rules.version)
+    return codes
+
+
+def _valid_text(col):
+    """متن تمیزشده هر بخش شرح؛ خالی و 'nan' حذف می‌شوند."""
+    lower = pd.Series(col, dtype=object).str.lower().to_numpy()
+    return np.where((col != "") & (lower != "nan"), col, "")
+
+
+def _date_parts(cost_date, has_resi):
+    """بخش «مورخ ...» شرح؛ فقط برای ردیف‌های بدون رسید انبار."""
+    parts = np.full(len(cost_date), "", dtype=object)
+    # truthiness خود مقدار خام (NaN هم True است و بعد به 'nan' می‌رسد)
+    use = np.fromiter(map(bool, cost_date), dtype=bool, count=len(cost_date)) & ~has_resi
+    if use.any():
+        text = np.array([str(v).strip() for v in cost_date[use]], dtype=object)
+        ok = _valid_text(text) != ""
+        parts[np.flatnonzero(use)[ok]] = "مورخ " + text[ok]
+    return parts
+
+
+def full_descriptions(norm, suffix):
+    """
+    شرح کامل همه ردیف‌ها به صورت ستونی.
+
+    بخش‌ها مثل قبل به ترتیب شرح، رسید انبار، فاکتور، فروشنده و تاریخ‌اند و
+    بخش خالی حذف می‌شود؛ suffix («طی تنخواه شماره ...») برای همه ردیف‌ها
+    یکی است و فقط یک بار ساخته می‌شود.
+    """
+    resi = norm["resi"].to_numpy()
+    factor = norm["factor"].to_numpy()
+    has_resi = resi != ""
+    has_factor = factor != ""
+    parts = (
+        _valid_text(norm["desc"].to_numpy()),
+        np.where(has_resi, "به شماره رسید انبار " + resi, ""),
+        np.where(has_factor, "شماره فاکتور " + factor, ""),
+        _valid_text(norm["seller"].to_numpy()),
+        _date_parts(norm["cost_date"].to_numpy(), has_resi),
+    )
+    out = np.full(len(norm), "", dtype=object)
+    for part in parts:
+        present = part != ""
+        join = present & (out != "")
+        out[join] = out[join] + " " + part[join]
+        first = present & ~join
+        out[first] = part[first]
+    filled = out != ""
+    out[filled] = out[filled] + (" " + suffix)
+    out[~filled] = suffix
+    return out
+
+
+def check_header(header):
+    """کنترل کامل بودن سربرگ؛ برای فیلد خالی ValueError می‌دهد."""
+    missing = [f for f in REQUIRED_HEADER_FIELDS if not str(header.get(f) or "").strip()]
+    if missing:
+        raise ValueError(f"فیلدهای سربرگ خالی است: {', '.join(missing)}")
+
+
+# ============================================================
+# نرمال‌سازی ستونی ورودی
+# ============================================================
+# ستون‌های فایل تنخواه که پردازش از آن‌ها استفاده می‌کند
+SOURCE_COLUMNS = (
+    "ناحیه",
+    "شرح سند",
+    "نام فروشنده / فروشگاه",
+    "شماره فاکتور",
+    "رسیدانبار",
+    "تاریخ",
+    "کارمزد",
+    "ارزش افزوده",
+    "مبلغ",
+    "گردش",
+    "پرداخت جمعی",
+    "پرداخت گروهی",
+    "مرکز هزینه",
+)
+
+# موتور خواندن اکسل: calamine در صورت نصب بودن، وگرنه openpyxl
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+# ستون‌های نرمال‌شده‌ای که حلقه سند روی آن‌ها کار می‌کند
+NORMALIZED_COLUMNS = (
+    "area",
+    "desc",
+    "seller",
+    "factor",
+    "resi",
+    "cost_date",
+    "fee",
+    "tax",
+    "amount",
+    "is_gardesh",
+    "group_flag",
+    "center_cost",
+)
+
+
+def find_group_col(columns):
+    """تشخیص ستون پرداخت جمعی (هر کدام موجود بود)."""
+    for cand in ["پرداخت جمعی", "پرداخت گروهی"]:
+        if cand in columns:
+            return cand
+    return None
+
+
+def _map_distinct(col, func):
+    """
+    اجرای یکی از توابع کمکی (extract_int_str و ...) فقط یک بار برای هر مقدار متمایز.
+
+    این توابع برای مقدار غیرخالی فقط به str(val) وابسته‌اند، پس کلید یکتاسازی
+    همان متن مقدار است.
+    """
+    out = np.empty(len(col), dtype=object)
+    na = col.isna().to_numpy()
+    out[na] = func(None)
+    if not na.all():
+        keys = np.array([str(v) for v in col.to_numpy(dtype=object)[~na]], dtype=object)
+        codes, uniques = pd.factorize(keys)
+        out[~na] = np.array([func(u) for u in uniques], dtype=object)[codes]
+    return out
+
+
+def _numeric_column(col):
+    """معادل ستونی clean_number: آرایه float که خالی/نامعتبر در آن 0 است."""
+    if is_numeric_dtype(col) and not is_bool_dtype(col):
+        return np.nan_to_num(col.to_numpy(dtype=float), nan=0.0)
+    return _map_distinct(col, clean_number).astype(float)
+
+
+def _text_column(col):
+    """معادل ستونی str(val).strip()؛ مقدار خالی همان 'nan' می‌شود."""
+    return pd.Series([str(v) for v in col.to_numpy(dtype=object)], dtype=object).str.strip().to_numpy()
+
+
+def _group_flag(gv):
+    try:
+        return float(gv) != 0
+    except Exception:
+        return True  # هر مقدار غیرخالی
+
+
+def normalize_frame(df):
+    """
+    تبدیل یک‌جای ستون‌های ورودی به ستون‌های NORMALIZED_COLUMNS.
+
+    مبلغ/کارمزد/ارزش افزوده عددی، شماره فاکتور و رسید انبار متن عدد صحیح
+    (با پشتیبانی '2532-2534') و مرکز هزینه کد ۶ رقمی می‌شود؛ ستون نبود،
+    مقدار پیش‌فرض همان حلقه قبلی را می‌گیرد.
+    """
+    df = df.rename(columns=lambda c: str(c).strip())  # حذف فاصله‌های اضافه از نام ستون‌ها
+    n = len(df)
+    empty_text = np.full(n, "", dtype=object)
+    zeros = np.zeros(n)
+
+    def column(name, convert, default):
+        return convert(df[name]) if name in df.columns else default
+
+    group_col = find_group_col(df.columns)
+    if group_col is not None:
+        gv = df[group_col]
+        group_flag = np.zeros(n, dtype=bool)
+        present = gv.notna().to_numpy()
+        if present.any():
+            codes, uniques = pd.factorize(gv.to_numpy(dtype=object)[present])
+            group_flag[present] = np.array([_group_flag(u) for u in uniques], dtype=bool)[codes]
+    else:
+        group_flag = np.zeros(n, dtype=bool)
+
+    return pd.DataFrame(
+        {
+            "area": column("ناحیه", _text_column, empty_text),
+            "desc": column("شرح سند", _text_column, empty_text),
+            "seller": column(
+                "نام فروشنده / فروشگاه",
+                lambda c: pd.Series(_text_column(c), dtype=object).str.replace("فروشگاه", "", regex=False).str.strip().to_numpy(),
+                empty_text,
+            ),
+            "factor": column("شماره فاکتور", lambda c: _map_distinct(c, extract_int_str), empty_text),
+            "resi": column("رسیدانبار", lambda c: _map_distinct(c, extract_int_str), empty_text),
+            # Series صریح object: آرایه‌ای که فقط Timestamp دارد وگرنه datetime64 می‌شود و str آن فرق می‌کند
+            "cost_date": column("تاریخ", lambda c: pd.Series(c.to_numpy(dtype=object), dtype=object),
+                                np.full(n, None, dtype=object)),
+            "fee": column("کارمزد", _numeric_column, zeros),
+            "tax": column("ارزش افزوده", _numeric_column, zeros),
+            "amount": column("مبلغ", _numeric_column, zeros),
+            "is_gardesh": column("گردش", lambda c: _text_column(c) == "گردش", np.zeros(n, dtype=bool)),
+            "group_flag": group_flag,
+            "center_cost": column("مرکز هزینه", lambda c: _map_distinct(c, get_center_cost_str), empty_text),
+        },
+        columns=list(NORMALIZED_COLUMNS),
+    )
+
+
+# ============================================================
+# جدول تصمیم مسیر ردیف‌ها
+# ============================================================
+# هر جدول فهرست (شرط، خروجی‌ها) است و برای هر ردیف اولین شرط برقرار
+# انتخاب می‌شود؛ شرط None پیش‌فرض است و باید آخر بیاید. مقدار رشته‌ای که
+# با «@» شروع شود نام یک ستون محاسبه‌شده است، بقیه مقدار ثابت‌اند.
+
+# کد معین و سطح چهارم هزینه
+ACCOUNT_ROUTES = (
+    # رسید انبار → 3120 و سطح چهارم انبار
+    ("receipt", {"account": 3120, "sath4_cost": "200082"}),
+    # پروژه پرند: سطح چهارم از ستون مرکز هزینه، وگرنه 005021
+    ("parand_center", {"account": "@keyword_account", "sath4_cost": "@center_cost"}),
+    ("parand", {"account": "@keyword_account", "sath4_cost": "005021"}),
+    (None, {"account": "@keyword_account", "sath4_cost": "@sath4_default"}),
+)
+
+# ستون‌های AO تا AU (TAX_FIELDS)
+TAX_ROUTES = (
+    # پرداخت 1131 ستون مالیاتی ندارد
+    ("settlement", dict.fromkeys(TAX_FIELDS)),
+    ("taxable", {"tax_status": "مشمول", "deal_type": "داخلی", "item_kind": "@item_kind", "trade_type": "خرید",
+                 "party_code": "5058", "tax_amount": "@tax", "duty_amount": 0}),
+    ("exempt", {"tax_status": "معاف", "deal_type": "داخلی", "item_kind": "@item_kind", "trade_type": "خرید",
+                "party_code": "5058", "tax_amount": None, "duty_amount": None}),
+    # بدون مبلغ
+    (None, {"tax_status": None, "deal_type": "داخلی", "item_kind": None, "trade_type": "خرید",
+            "party_code": "5058", "tax_amount": None, "duty_amount": None}),
+)
+
+
+def evaluate_routes(routes, masks, columns):
+    """
+    ارزیابی یک جدول تصمیم روی کل تکه با np.select.
+
+    masks شرط‌های بولی و columns ستون‌های «@» است؛ خروجی برای هر فیلد
+    جدول یک آرایه object (مقادیر پایتونی) است.
+    """
+    conditions = [masks[name] for name, _ in routes[:-1]]
+    out = {}
+    for field in routes[-1][1]:
+        choices = []
+        for _, outputs in routes:
+            value = outputs[field]
+            if isinstance(value, str) and value.startswith("@"):
+                value = columns[value[1:]]
+            choices.append(np.asarray(value, dtype=object))
+        out[field] = np.select(conditions, choices[:-1], default=choices[-1]) if conditions else choices[-1]
+    return out
+
+
+def route_rows(norm, tanakh_name, sath4_default, sath5_use, is_parand, rules, store=None, metrics=None):
+    """
+    کد معین، سطح چهارم هزینه و ستون‌های مالیاتی همه ردیف‌های یک تکه.
+
+    تشخیص کد از روی شرح فقط یک بار برای هر شرح متمایزِ ردیف‌های بدون رسید
+    انجام می‌شود (مرحله classify)؛ با store از حافظه ماندگار.
+    """
+    n = len(norm)
+    resi = norm["resi"].to_numpy()
+    center_cost = norm["center_cost"].to_numpy()
+    amount = norm["amount"].to_numpy()
+    tax = norm["tax"].to_numpy()
+    receipt = resi != ""
+
+    keyword_account = np.zeros(n, dtype=object)
+    descs = norm["desc"].to_numpy()[~receipt]
+    with _stage(metrics, "classify", len(descs)):
+        codes, uniques = pd.factorize(descs)
+        stats = metrics.info.setdefault("store_hits", {}) if metrics is not None and store is not None else None
+        keyword_account[~receipt] = np.array(
+            classify_descriptions(uniques, sath5_use, tanakh_name, rules, store, stats), dtype=object
+        )[codes]
+
+    routes = evaluate_routes(
+        ACCOUNT_ROUTES,
+        {"receipt": receipt, "parand_center": is_parand & (center_cost != ""), "parand": np.full(n, is_parand)},
+        {"keyword_account": keyword_account, "center_cost": center_cost, "sath4_default": sath4_default},
+    )
+    account = routes["account"]
+    codes, uniques = pd.factorize(account)
+    item_kind = np.array([rules.item_types.get(code) or None for code in uniques], dtype=object)[codes]
+    routes.update(evaluate_routes(
+        TAX_ROUTES,
+        {"settlement": account == 1131, "taxable": (amount > 0) & (tax > 0), "exempt": amount > 0},
+        {"item_kind": item_kind, "tax": tax},
+    ))
+    return routes
+
+
+# ============================================================
+# گروه‌بندی ردیف‌های تسویه (1131)
+# ============================================================
+# جمع ترتیبی اشیای پایتون؛ np.add روی float جمع جفتی می‌کند و ممکن است
+# رقم آخر آن با جمع ردیف‌به‌ردیف نسخه قبلی فرق کند
+_add = np.frompyfunc(operator.add, 2, 1)
+
+
+def _run_sums(values, rows, seg_pos, inits):
+    """جمع چپ‌به‌راست values[rows] در هر بخش (شروع از seg_pos) با مقدار اولیه inits."""
+    vals = np.insert(values[rows].astype(object), seg_pos, inits)
+    return _add.reduceat(vals, seg_pos + np.arange(len(seg_pos)))
+
+
+def is_almasi_tanakh(tanakh_name):
+    """تنخواه‌دار الماسی: 1131 کلی برای هر ناحیه به جای پرداخت جمعی."""
+    return "الماسی" in name_key(tanakh_name)
+
+
+def settlement_keys(norm, is_almasi):
+    """کلید دنباله هر ردیف: ناحیه برای الماسی، True برای عضو پرداخت جمعی؛ None بیرون از دنباله."""
+    if is_almasi:
+        area = norm["area"].to_numpy()
+        return np.where(area != "", area, None)
+    return np.where(norm["group_flag"].to_numpy(), True, None)
+
+
+def settlement_runs(keys, amount, fee, tax, desc, carry=None):
+    """
+    برچسب‌گذاری دنباله‌های پشت‌سرهم هم‌کلید و جمع هر دنباله برای سطر 1131.
+
+    keys کلید دنباله هر ردیف است (ناحیه برای الماسی، True برای عضو پرداخت
+    جمعی) و None یعنی ردیف عضو هیچ دنباله‌ای نیست. هر دنباله با اولین ردیفی
+    که کلید دیگری دارد بسته می‌شود. هر دنباله یک دیکشنری است:
+    {key, count, amount, fee, tax, total, first_desc, last_desc}.
+
+    خروجی (closings, carry) است: closings[i] دنباله‌ای است که درست پیش از
+    ردیف i بسته می‌شود (یا None)، و carry دنباله‌ای که در پایان این تکه باز
+    مانده است. carry ورودی دنباله باز تکه قبلی است و اگر ادامه پیدا کند
+    جمع‌ها از همان‌جا ادامه می‌یابد.
+    """
+    n = len(keys)
+    closings = np.full(n, None, dtype=object)
+    if n == 0:
+        return closings, carry
+
+    prev = np.empty(n, dtype=object)
+    prev[0] = carry["key"] if carry is not None else None
+    prev[1:] = keys[:-1]
+    changed = keys != prev
+    rows = np.flatnonzero(pd.notna(keys))
+    seg_pos = np.flatnonzero(changed[rows])  # شروع هر دنباله در rows
+    continued = carry is not None and not changed[0]
+    if continued:
+        seg_pos = np.concatenate(([0], seg_pos))
+    elif carry is not None:
+        closings[0] = carry
+
+    runs = len(seg_pos)
+    if not runs:
+        return closings, None
+    ends = np.append(seg_pos[1:], len(rows))
+    first_rows = rows[seg_pos]
+    last_rows = rows[ends - 1]
+    counts = ends - seg_pos
+    sums = {}
+    for name, values in (("amount", amount), ("fee", fee), ("tax", tax)):
+        inits = [0] * runs
+        if continued:
+            inits[0] = carry[name]
+        sums[name] = _run_sums(values, rows, seg_pos, inits)
+
+    new_carry = None
+    for j in range(runs):
+        run = {
+            "key": keys[first_rows[j]],
+            "count": int(counts[j]) + (carry["count"] if continued and j == 0 else 0),
+            "amount": sums["amount"][j],
+            "fee": sums["fee"][j],
+            "tax": sums["tax"][j],
+            "first_desc": carry["first_desc"] if continued and j == 0 else desc[first_rows[j]],
+            "last_desc": desc[last_rows[j]],
+        }
+        run["total"] = run["amount"] + run["fee"] + run["tax"]
+        end = last_rows[j] + 1
+        if end < n:
+            closings[end] = run
+        else:
+            new_carry = run
+    return closings, new_carry
+
+
+# ============================================================
+# ساخت سطرهای سند
+# ============================================================
+# مراحل جدا (غیرتودرتوی) خواندن و ساخت سطرها؛ classify داخل route است
+_BUILD_STAGES = ("read", "normalize", "group", "describe", "route", "loop")
+
+
+def _stage(metrics, name, rows=None):
+    return metrics.stage(name, rows) if metrics is not None else nullcontext()
+
+
+def build_voucher(df, header, metrics=None, store=None):
+    """
+    ساخت سطرهای سند از دیتافریم تنخواه.
+
+    خروجی فهرستی از VoucherLine است به همان ترتیب سطرهای سند. اگر metrics
+    (voucher_metrics.JobMetrics) داده شود زمان مراحل normalize، group،
+    describe، route (شامل classify) و loop در آن ثبت می‌شود. با store
+    (voucher_store.AccountStore) اصلاح‌های دستی کد معین اعمال می‌شود.
+    """
+    return list(iter_voucher_lines([df], header, metrics, store))
+
+
+def iter_voucher_lines(frames, header, metrics=None, store=None, rules=None, carry=None, close_carry=True,
+                       origins=None):
+    """
+    ساخت سطرهای سند از تکه‌های پشت‌سرهم یک فایل تنخواه.
+
+    frames هر iterable از دیتافریم است (مثلاً خروجی iter_tankhah). وضعیت
+    ناحیه جاری الماسی و پرداخت جمعی باز بین تکه‌ها حفظ می‌شود، پس خروجی با
+    build_voucher روی کل فایل یکی است؛ سطرهای هر تکه بلافاصله پس از پردازش
+    آن تکه yield می‌شوند و حافظه به اندازه یک تکه می‌ماند.
+
+    برای ساختن یک بازه از وسط فایل (build_voucher_parallel): carry دنباله‌ای
+    است که پیش از اولین ردیف باز مانده و با close_carry=False دنباله باز
+    پایان بازه بسته نمی‌شود (بازه بعدی آن را می‌بندد).
+
+    با فهرست origins، شماره ردیف ورودی هر سطر (از 0 در کل frames) به آن
+    اضافه می‌شود؛ سطر 1131 بستن یک دنباله مال آخرین ردیف همان دنباله است
+    (برای دنباله carry یعنی -1).
+    """
+    check_header(header)
+    tanakh_number = header["tanakh_number"]
+    tanakh_name = header["tanakh_name"]
+    date_input = header["date_input"]
+    project_name = header["project_name"]
+    sath4_default = header["sath4_default"]
+    sath5_default = header["sath5_default"]
+    sath4_fee_input = header.get("sath4_fee_input") or ""
+    # یک نسخه قوانین برای کل فایل، حتی اگر وسط کار فایل قوانین عوض شود
+    if rules is None:
+        rules = get_rules()
+
+    cache_before = _classify.cache_info()
+
+    lines = []
+    # ستون‌های AO تا AU هر ردیف ورودی روی اولین سطری می‌نشیند که آن ردیف
+    # تولید می‌کند (حتی اگر آن سطر بستن ناحیه/گروه قبلی باشد)
+    pending_tax = None
+    # شماره ردیف جاری در کل frames
+    row = -1
+
+    def add_line(source=None, **fields):
+        nonlocal pending_tax
+        if origins is not None:
+            origins.append(row if source is None else source)
+        line = VoucherLine(**fields)
+        if pending_tax is not None:
+            (line.tax_status, line.deal_type, line.item_kind, line.trade_type,
+             line.party_code, line.tax_amount, line.duty_amount) = pending_tax
+            pending_tax = None
+        lines.append(line)
+
+    def add_cost_lines(account_code, full_desc, amount, tax, fee, sath4_cost, sath5_cost, sath4_fee):
+        # هزینه
+        add_line(date=date_input, summary=summary, account=account_code, description=full_desc,
+                 debit=amount if amount else None, sath4=sath4_cost, sath5=sath5_cost)
+        # مالیات
+        if tax > 0:
+            add_line(date=date_input, summary=summary, account=3221, description="بابت ارزش افزوده",
+                     debit=tax, sath4=sath4_cost, sath5=sath5_cost)
+        # کارمزد
+        if fee > 0:
+            add_line(date=date_input, summary=summary, account=7512, description="بابت کارمزد بانکی",
+                     debit=fee, sath4=sath4_fee, sath5=sath5_cost)
+
+    def add_gardesh_lines(full_desc, amount, sath5_use):
+        for col in ["debit", "credit"]:
+            add_line(date=date_input, summary=summary, account=3120, description=full_desc,
+                     **{col: amount}, sath4="", sath5=sath5_use)
+
+    # آماده‌سازی سطح‌ها
+    sath4_default_z = sath4_default.zfill(6)
+    sath5_default_z = sath5_default.zfill(6)
+    sath4_tanakh = rules.tanakh_sath4.get(name_key(tanakh_name), "")
+    sath4_tanakh = sath4_tanakh.zfill(6) if sath4_tanakh else ""
+
+    # سطح چهارم کارمزد ورودی (فقط برای پرند استفاده می‌شود)
+    sath4_fee_z = sath4_fee_input.zfill(6) if sath4_fee_input.strip() else "005021"
+
+    # سطح پنجم هزینه (عطا/زابلی دفتر مرکزی) و سطح چهارم کارمزد برای همه ردیف‌ها یکی است
+    sath5_use = "006003" if name_key(tanakh_name) in rules.exception_holders else sath5_default_z
+    is_parand = name_key(project_name) == "پرند"
+    sath4_fee = sath4_fee_z if is_parand else sath4_default_z
+
+    is_almasi = is_almasi_tanakh(tanakh_name)
+
+    summary = f"صورتخلاصه تنخواه شماره {tanakh_number} طی تنخواه {tanakh_name} پروژه {project_name}"
+    # پسوند شرح کامل همه ردیف‌ها
+    desc_suffix = f"طی تنخواه شماره {tanakh_number} {tanakh_name} پروژه {project_name}".strip()
+
+    def group_payment_desc(run, desc):
+        # شرح پرداخت گروهی: desc داده‌شده، وگرنه تعداد فقره‌ها
+        group_pay_desc = desc or f"پرداخت جمعی {run['count']} فقره فاکتور طی تنخواه شماره {tanakh_number} {tanakh_name}"
+        return f"{group_pay_desc} پروژه {project_name}"
+
+    # ---------------------------
+    # حلقه ردیف‌ها
+    # ---------------------------
+    for df in frames:
+        with _stage(metrics, "normalize", len(df)):
+            norm = normalize_frame(df)
+
+        # الماسی: 1131 برای هر دنباله هم‌ناحیه؛ سایرین: برای هر دنباله پرداخت جمعی
+        # (carry: دنباله‌ای که در پایان تکه قبلی باز مانده است)
+        with _stage(metrics, "group", len(norm)):
+            closings, carry = settlement_runs(
+                settlement_keys(norm, is_almasi), norm["amount"].to_numpy(), norm["fee"].to_numpy(), norm["tax"].to_numpy(),
+                norm["desc"].to_numpy(), carry,
+            )
+
+        with _stage(metrics, "describe", len(norm)):
+            full_descs = full_descriptions(norm, desc_suffix)
+
+        # کد معین، سطح چهارم و ستون‌های AO تا AU از جدول تصمیم
+        with _stage(metrics, "route", len(norm)):
+            routes = route_rows(norm, tanakh_name, sath4_default_z, sath5_use, is_parand, rules, store, metrics)
+        pending_taxes = zip(*(routes[field].tolist() for field in TAX_FIELDS))
+
+        if metrics is not None:
+            metrics.begin("loop")
+        for (area_val, desc, fee, tax, amount, is_gardesh, group_flag,
+             account_code, sath4_cost, pending_tax, closing, full_desc) in zip(
+                norm["area"].tolist(), norm["desc"].tolist(), norm["fee"].tolist(), norm["tax"].tolist(),
+                norm["amount"].tolist(), norm["is_gardesh"].tolist(), norm["group_flag"].tolist(),
+                routes["account"].tolist(), routes["sath4_cost"].tolist(), pending_taxes, closings, full_descs):
+            row += 1
+            # ====================================================
+            # شاخه 1: تنخواه‌دار الماسی → 1131 کلی برای هر ناحیه
+            # ====================================================
+            if is_almasi:
+                # ناحیه قبلی اینجا تمام شده (ناحیه جدید یا ردیف بدون ناحیه)
+                if closing is not None:
+                    add_line(source=row - 1, date=date_input,
+                             summary=f"پرداخت ناحیه {closing['key']} طی تنخواه {tanakh_number} {tanakh_name} پروژه {project_name}",
+                             account=1131, description=f"پرداخت ناحیه {closing['key']}",
+                             credit=closing["total"], sath4=sath4_tanakh, sath5="")
+
+                add_cost_lines(account_code, full_desc, amount, tax, fee,
+                               sath4_cost, sath5_use, sath4_fee)
+
+                # (اختیاری) گردش؛ فقط برای ردیف‌های داخل ناحیه
+                if area_val and is_gardesh:
+                    add_gardesh_lines(full_desc, amount, sath5_use)
+
+                # الماسی → 1131 ردیفی نداریم؛ در پایان ناحیه
+                continue
+
+            # ====================================================
+            # شاخه 2: سایر تنخواه‌دارها
+            #   + پرداخت جمعی (گروه) بر اساس ستون پرداخت جمعی
+            #   + پرداخت عادی در غیر اینصورت
+            # ====================================================
+
+            # گروه قبلی با این ردیف (غیرعضو) تمام شده → 1131 گروه
+            if closing is not None:
+                add_line(source=row - 1, date=date_input, summary=summary, account=1131,
+                         description=group_payment_desc(closing, desc),
+                         credit=closing["total"], sath4=sath4_tanakh, sath5="")
+
+                # اگر این ردیف خودش هیچ مبلغی ندارد (مثل ردیف «بابت ... فقره») دیگر پردازشش نکنیم
+                if (amount == 0) and (fee == 0) and (tax == 0):
+                    continue
+                # اگر مبلغ دارد، از اینجا ادامه منطق عادی (بدون گروه) می‌رود
+
+            # اگر ردیف عضو گروه است: هزینه / مالیات / کارمزد بدون 1131
+            if group_flag:
+                add_cost_lines(account_code, full_desc, amount, tax, fee,
+                               sath4_cost, sath5_use, sath4_fee)
+
+                # (اختیاری) گردش
+                if is_gardesh:
+                    add_gardesh_lines(full_desc, amount, sath5_use)
+
+                continue  # مهم! برای ردیف‌های گروهی 1131 زده نمی‌شود
+
+            # اگر نه گروه فعال است نه گروه_flag → ردیف عادیِ غیرگروهی → منطق اصلی پرداخت تک‌به‌تک
+            add_cost_lines(account_code, full_desc, amount, tax, fee,
+                           sath4_cost, sath5_use, sath4_fee)
+
+            # پرداخت 1131 برای همین ردیف
+            total_row = (amount or 0) + (fee or 0) + (tax or 0)
+            add_line(date=date_input, summary=summary, account=1131,
+                     description=full_desc,  # شرح پرداخت = شرح هزینه
+                     credit=total_row, sath4=sath4_tanakh, sath5="")
+
+            # (اختیاری) گردش
+            if is_gardesh:
+                add_gardesh_lines(full_desc, amount, sath5_use)
+
+        if metrics is not None:
+            metrics.end("loop", len(norm))
+
+        # سطرهای این تکه آماده است
+        yield from lines
+        lines.clear()
+
+    # ====================================================
+    # پایان حلقه‌ها
+    # ====================================================
+
+    if not close_carry:
+        carry = None
+
+    # اگر الماسی و آخرین ناحیه باز مانده، ببند
+    if is_almasi and carry is not None:
+        add_line(date=date_input, summary=summary, account=1131, description=f"پرداخت ناحیه {carry['key']}",
+                 credit=carry["total"], sath4=sath4_tanakh, sath5="")
+
+    # اگر گروه پرداخت جمعی باز مانده بود (در غیر الماسی‌ها)
+    if (not is_almasi) and carry is not None:
+        add_line(date=date_input, summary=summary, account=1131,
+                 description=group_payment_desc(carry, carry["last_desc"] or carry["first_desc"]),
+                 credit=carry["total"], sath4=sath4_tanakh, sath5="")
+
+    if metrics is not None:
+        metrics.info["classify_cache_hits"] = _classify.cache_info().hits - cache_before.hits
+    yield from lines
+
+
+# ============================================================
+# ساخت موازی یک فایل بزرگ
+# ============================================================
+# فایل‌های کوچک‌تر از این تعداد ردیف موازی ساخته نمی‌شوند (راه‌اندازی پروسه‌ها گران‌تر است)
+PARALLEL_MIN_ROWS = 20000
+
+
+def row_settlement_keys(df, tanakh_name):
+    """settlement_keys برای دیتافریم خام (فقط ستون ناحیه یا پرداخت جمعی نرمال می‌شود)."""
+    is_almasi = is_almasi_tanakh(tanakh_name)
+    named = df.rename(columns=lambda c: str(c).strip())
+    key_col = "ناحیه" if is_almasi else find_group_col(named.columns)
+    return settlement_keys(normalize_frame(named[[c for c in (key_col,) if c in named.columns]]), is_almasi)
+
+
+def safe_boundaries(keys, targets):
+    """
+    برای هر ردیف هدف، اولین مرز امن از آن به بعد (مرتب و بدون تکرار، بدون 0).
+
+    مرز امن ردیفی است که هیچ دنباله ناحیه/پرداخت جمعی از روی آن رد نمی‌شود:
+    یا ردیف قبلش بیرون از دنباله است، یا دنباله قبلی درست همان‌جا بسته
+    می‌شود (در الماسی ناحیه خالی هم «nan» است، پس تقریباً همه مرزها از
+    نوع دوم‌اند).
+    """
+    n = len(keys)
+    if n < 2:
+        return []
+    prev = keys[:-1]
+    safe = np.flatnonzero(pd.isna(prev) | (keys[1:] != prev)) + 1
+    idx = np.searchsorted(safe, targets)
+    return sorted({int(safe[i]) for i in idx if i < len(safe)})
+
+
+def run_start(keys, end):
+    """شروع دنباله‌ای که درست پیش از ردیف end تمام می‌شود؛ بدون دنباله خود end."""
+    if not end or keys[end - 1] is None:
+        return end
+    first = end - 1
+    while first and keys[first - 1] == keys[end - 1]:
+        first -= 1
+    return first
+
+
+def carry_before(df, keys, start):
+    """
+    دنباله‌ای که درست پیش از مرز امن start بسته می‌شود (یا None).
+
+    فقط از روی ردیف‌های خود دنباله حساب می‌شود و همان carry است که ساخت
+    تکه‌تکه در آن نقطه داشت؛ ردیف start سطر 1131 آن را می‌سازد.
+    """
+    first = run_start(keys, start)
+    if first == start:
+        return None
+    run = normalize_frame(df.iloc[first:start])
+    return settlement_runs(keys[first:start], run["amount"].to_numpy(), run["fee"].to_numpy(),
+                           run["tax"].to_numpy(), run["desc"].to_numpy())[1]
+
+
+def split_segments(df, tanakh_name, parts):
+    """
+    تقسیم ردیف‌های df به حداکثر parts بازه پشت‌سرهم در مرزهای امن.
+
+    خروجی فهرست (شروع، پایان، carry) است؛ carry دنباله‌ای است که بازه باید
+    اول آن را ببندد (carry_before).
+    """
+    n = len(df)
+    if parts <= 1 or n < 2:
+        return [(0, n, None)]
+    keys = row_settlement_keys(df, tanakh_name)
+    starts = safe_boundaries(keys, [n * p // parts for p in range(1, parts)])
+    return [(start, end, carry_before(df, keys, start)) for start, end in zip([0, *starts], [*starts, n])]
+
+
+def _build_segment(df, header, rules, carry, close_carry, store, timed, track_memory=False, with_origins=False):
+    """
+    ساخت یک بازه در پروسه کارگر؛ خروجی (مقادیر سطرها، (مراحل، اطلاعات) یا None،
+    ردیف مبدأ هر سطر نسبت به شروع بازه یا None).
+    """
+    metrics = None
+    if timed:
+        from voucher_metrics import JobMetrics
+        metrics = JobMetrics(track_memory=track_memory)
+    origins = [] if with_origins else None
+    values = [line.values() for line in iter_voucher_lines([df], header, metrics, store, rules, carry, close_carry,
+                                                           origins=origins)]
+    return values, (metrics.stages, metrics.info) if timed else None, origins
+
+
+def build_voucher_parallel(df, header, workers=None, metrics=None, store=None, progress=None, origins=None):
+    """
+    ساخت سند یک فایل بزرگ روی چند پروسه.
+
+    ردیف‌ها در مرزهای امن (split_segments) به workers بازه تقسیم و هر بازه
+    در یک پروسه جدا ساخته می‌شود؛ سطرها به ترتیب بازه‌ها کنار هم گذاشته
+    می‌شوند و با build_voucher یکی است. خروجی فهرست مقادیر هر سطر (به
+    ترتیب LINE_FIELDS، مثل VoucherLine.values) است تا برگرداندن آن از
+    پروسه‌ها ارزان بماند. زمان مراحل در metrics جمع زمان همه پروسه‌هاست.
+    progress (Progress) پس از تمام شدن هر بازه گزارش می‌شود. با فهرست origins
+    شماره ردیف df هر سطر به آن اضافه می‌شود (مثل iter_voucher_lines).
+    """
+    check_header(header)
+    workers = workers or os.cpu_count() or 1
+    # یک نسخه قوانین برای همه بازه‌ها
+    rules = get_rules()
+    with _stage(metrics, "split", len(df)):
+        segments = split_segments(df, header["tanakh_name"], workers)
+
+    if len(segments) == 1:
+        # مرز امنی پیدا نشد (یا یک پروسه)؛ بدون هزینه راه‌اندازی pool
+        values = [line.values() for line in iter_voucher_lines([df], header, metrics, store, rules, origins=origins)]
+        if progress is not None:
+            progress.rows += len(df)
+            progress.report()
+        return values
+
+    started = time.perf_counter()
+    results = [None] * len(segments)
+    segment_origins = [None] * len(segments)
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(segments)))
+    try:
+        futures = {
+            pool.submit(_build_segment, df.iloc[start:end], header, rules, carry, end == len(df), store,
+                        metrics is not None, metrics is not None and metrics.track_memory, origins is not None): i
+            for i, (start, end, carry) in enumerate(segments)
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            results[i], timing, segment_origins[i] = fut.result()
+            if timing is not None:
+                stages, info = timing
+                for name, st in stages.items():
+                    metrics.add(name, st["seconds"], st["rows"], st["peak_mb"])
+                metrics.info["classify_cache_hits"] = (metrics.info.get("classify_cache_hits", 0)
+                                                       + info.get("classify_cache_hits", 0))
+                for source, count in info.get("store_hits", {}).items():
+                    hits = metrics.info.setdefault("store_hits", {})
+                    hits[source] = hits.get(source, 0) + count
+            if progress is not None:
+                start, end, _ = segments[i]
+                progress.rows += end - start
+                progress.report()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    if metrics is not None:
+        metrics.info.update(segments=len(segments), parallel_seconds=round(time.perf_counter() - started, 4))
+    if origins is not None:
+        for (start, _, _), rows in zip(segments, segment_origins):
+            origins.extend(start + row for row in rows)
+    return [values for segment in results for values in segment]
+
+
+# ============================================================
+# خروجی اکسل
+# ============================================================
+# ستون‌هایی که سند در آن‌ها می‌نویسد
+OUTPUT_COLUMNS = tuple(LINE_COLUMNS[f] for f in LINE_FIELDS)
+_OUTPUT_INDEX = tuple(column_index_from_string(col) - 1 for col in OUTPUT_COLUMNS)
+_ROW_WIDTH = max(_OUTPUT_INDEX) + 1
+
+
+def _cell_style(obj):
+    """استایل سلول یا ستون قالب به صورت (font, fill, border, alignment, number_format)؛ بدون استایل (None,)."""
+    if not obj.has_style:
+        return (None,)
+    return copy(obj.font), copy(obj.fill), copy(obj.border), copy(obj.alignment), obj.number_format
+
+
+def _apply_style(obj, style):
+    """استایل _cell_style روی سلول یا ستون کارپوشه خروجی."""
+    if style[0] is not None:
+        obj.font, obj.fill, obj.border, obj.alignment, obj.number_format = style
+
+
+def load_template(template_path=TEMPLATE_PATH):
+    """
+    خواندن قالب سند: عنوان برگه، سطرهای سربرگ (مقدار و استایل هر سلول)،
+    ستون‌ها (بازه min تا max، عرض و استایل)، ارتفاع سطرها و جهت راست‌به‌چپ.
+    """
+    ws = load_workbook(template_path).active
+    header_rows = tuple(
+        tuple((cell.value, *_cell_style(cell)) for cell in row)
+        for row in ws.iter_rows()
+    )
+    return {
+        "title": ws.title,
+        "header_rows": header_rows,
+        # هر <col> قالب می‌تواند چند ستون را بپوشاند (مثلاً C:D)؛ min و max همان‌طور می‌مانند
+        "columns": tuple(
+            (key, dim.min, dim.max, dim.width, _cell_style(dim))
+            for key, dim in ws.column_dimensions.items() if dim.width or dim.has_style
+        ),
+        "heights": {idx: dim.height for idx, dim in ws.row_dimensions.items() if dim.height},
+        "right_to_left": ws.sheet_view.rightToLeft,
+    }
+
+
+# قالب خوانده‌شده برای هر مسیر: {مسیر: (mtime_ns, قالب)}؛ بین همه نشست‌های پروسه مشترک است
+_template_cache = {}
+_template_lock = threading.Lock()
+
+
+def get_template(template_path=TEMPLATE_PATH):
+    """
+    قالب سند از حافظه؛ فقط وقتی فایل قالب عوض شده باشد (mtime) دوباره خوانده می‌شود.
+
+    خروجی فقط خواندنی است و write_voucher از روی آن کارپوشه تازه می‌سازد.
+    """
+    path = os.path.abspath(template_path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _template_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _template_lock:
+        cached = _template_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, load_template(path))
+            _template_cache[path] = cached
+    return cached[1]
+
+
+def _line_to_row(line):
+    row = [None] * _ROW_WIDTH
+    for pos, field in zip(_OUTPUT_INDEX, LINE_FIELDS):
+        row[pos] = getattr(line, field)
+    return row
+
+
+def _values_to_row(values):
+    row = [None] * _ROW_WIDTH
+    for pos, value in zip(_OUTPUT_INDEX, values):
+        row[pos] = value
+    return row
+
+
+def write_voucher(lines, template_path=TEMPLATE_PATH, out=None, as_values=False):
+    """
+    نوشتن سطرهای سند زیر سربرگ قالب و برگرداندن بایت‌های فایل خروجی.
+
+    از کارپوشه write-only استفاده می‌شود: هر سطر سند یک‌جا با ws.append
+    نوشته می‌شود و زمان/حافظه خطی با تعداد سطرهاست. lines می‌تواند
+    generator باشد؛ با as_values هر سطر فهرست مقادیر (VoucherLine.values)
+    است. اگر out (مسیر یا فایل) داده شود سند مستقیم در آن ذخیره می‌شود و
+    None برمی‌گردد.
+    """
+    template = get_template(template_path)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(template["title"])
+    ws.sheet_view.rightToLeft = template["right_to_left"]
+    for key, first, last, width, style in template["columns"]:
+        dim = ws.column_dimensions[key]
+        dim.min, dim.max = first, last
+        if width:
+            dim.width = width
+        _apply_style(dim, style)
+    for idx, height in template["heights"].items():
+        ws.row_dimensions[idx].height = height
+
+    for header_row in template["header_rows"]:
+        cells = []
+        for value, *style in header_row:
+            cell = WriteOnlyCell(ws, value=value)
+            _apply_style(cell, style)
+            cells.append(cell)
+        ws.append(cells)
+
+    to_row = _values_to_row if as_values else _line_to_row
+    for line in lines:
+        ws.append(to_row(line))
+
+    if out is not None:
+        wb.save(out)
+        return None
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def voucher_totals(lines):
+    """
+    جمع بدهکار و بستانکار و تعداد سطر هر کد معین: {کد: (بدهکار, بستانکار, سطرها)}.
+
+    lines هر دنباله‌ای از رکوردهای دارای account، debit و credit است
+    (VoucherLine یا ردیف‌های itertuples جدول پیش‌نمایش).
+    """
+    totals = {}
+    for line in lines:
+        debit, credit, count = totals.get(line.account, (0, 0, 0))
+        totals[line.account] = (debit + (line.debit or 0), credit + (line.credit or 0), count + 1)
+    return totals
+
+
+def _is_source_column(name):
+    return str(name).strip() in SOURCE_COLUMNS
+
+
+def _is_csv(src, filename):
+    name = filename or (src if isinstance(src, (str, os.PathLike)) else getattr(src, "name", ""))
+    return str(name).lower().endswith(".csv")
+
+
+def read_tankhah(src, filename=None):
+    """
+    خواندن فایل تنخواه (xlsx یا csv) فقط با ستون‌های SOURCE_COLUMNS.
+
+    ستون‌های لازم یک بار از روی سطر عنوان انتخاب می‌شوند و بقیه ستون‌های
+    برگه اصلاً به دیتافریم تبدیل نمی‌شوند. اگر python-calamine نصب باشد
+    اکسل با آن خوانده می‌شود که چند برابر سریع‌تر از openpyxl است.
+    """
+    if _is_csv(src, filename):
+        return pd.read_csv(src, usecols=_is_source_column, encoding="utf-8-sig")
+    return pd.read_excel(src, usecols=_is_source_column, engine=EXCEL_ENGINE)
+
+
+# تعداد ردیف ورودی هر تکه در حالت جریانی و در گزارش پیشرفت
+STREAM_CHUNK_ROWS = 5000
+
+
+class Progress:
+    """
+    شمارش ردیف‌های پردازش‌شده و سطرهای نوشته‌شده، با گزارش پس از هر تکه.
+
+    callback(ردیف‌ها، سطرها، کل ردیف‌ها یا None) پس از هر تکه ورودی (و در
+    نوشتن، هر every سطر) صدا زده می‌شود؛ اگر خطا بدهد (مثلاً لغو کار) کار
+    همان‌جا متوقف می‌شود.
+    """
+
+    def __init__(self, callback=None, total_rows=None):
+        self.callback = callback
+        self.total_rows = total_rows
+        self.rows = 0
+        self.lines = 0
+
+    def frames(self, frames):
+        for frame in frames:
+            yield frame
+            # اینجا سطرهای تکه قبلی همه مصرف (یا نوشته) شده‌اند
+            self.rows += len(frame)
+            self.report()
+
+    def count(self, lines, every=None):
+        for line in lines:
+            self.lines += 1
+            if every and self.lines % every == 0:
+                self.report()
+            yield line
+
+    def report(self):
+        if self.callback is not None:
+            self.callback(self.rows, self.lines, self.total_rows)
+
+
+def process_file(src, header, template_path=TEMPLATE_PATH, filename=None, metrics=None, store=None,
+                 progress=None, chunksize=STREAM_CHUNK_ROWS, workers=1, preview=None):
+    """
+    خواندن فایل تنخواه، ساخت سند و برگرداندن (بایت‌های خروجی، تعداد سطر).
+
+    با metrics زمان مراحل read، template، normalize، group، describe، route
+    (و classify درون آن)، loop و write ثبت می‌شود. با progress (تابع، مثل
+    Progress) سند chunksize ردیف به chunksize ردیف ساخته و پیشرفت ساخت و
+    سپس نوشتن گزارش می‌شود؛ خروجی یکسان است. با workers بیش از یک، فایل‌های
+    دست‌کم PARALLEL_MIN_ROWS ردیفی با build_voucher_parallel ساخته می‌شوند.
+    با فهرست preview، VoucherPreview سند (voucher_preview، مرحله preview) به
+    آن اضافه می‌شود.
+    """
+    if metrics is not None:
+        metrics.begin("read")
+    df = read_tankhah(src, filename)
+    if metrics is not None:
+        metrics.end("read", len(df))
+    with _stage(metrics, "template"):
+        get_template(template_path)
+    counter = Progress(progress, len(df))
+    parallel = workers > 1 and len(df) >= PARALLEL_MIN_ROWS
+    origins = [] if preview is not None else None
+    if parallel:
+        counter.report()
+        lines = build_voucher_parallel(df, header, workers, metrics, store, counter, origins)
+    elif progress is None:
+        lines = list(iter_voucher_lines([df], header, metrics, store, origins=origins))
+    else:
+        counter.report()
+        frames = (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+        lines = list(iter_voucher_lines(counter.frames(frames), header, metrics, store, origins=origins))
+    if preview is not None:
+        from voucher_preview import VoucherPreview
+
+        with _stage(metrics, "preview", len(lines)):
+            preview.append(VoucherPreview(lines, origins, df, header["tanakh_name"]))
+    with _stage(metrics, "write", len(lines)):
+        data = write_voucher(lines if progress is None else counter.count(lines, chunksize), template_path,
+                             as_values=parallel)
+    if metrics is not None:
+        metrics.info.update(rows=len(df), lines=len(lines), output_bytes=len(data))
+    return data, len(lines)
+
+
+# ============================================================
+# حالت جریانی (حافظه محدود)
+# ============================================================
+def _excel_cell(cell):
+    """تبدیل مقدار سلول مثل خواننده openpyxl خود pandas."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+
+def _excel_rows(src):
+    """ردیف‌های اولین برگه اکسل یکی‌یکی؛ ردیف‌های خالی انتهای برگه حذف می‌شوند."""
+    wb = load_workbook(src, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        blank = 0
+        for row in ws.iter_rows():
+            values = [_excel_cell(cell) for cell in row]
+            if any(v != "" for v in values):
+                # ردیف خالی وسط برگه (نه انتهای آن) نگه داشته می‌شود
+                for _ in range(blank):
+                    yield []
+                blank = 0
+                yield values
+            else:
+                blank += 1
+    finally:
+        wb.close()
+
+
+def _excel_chunks(src, chunksize, dtype=None):
+    rows = _excel_rows(src)
+    header = next(rows, None)
+    if header is None:
+        return
+    keep, seen = [], set()
+    for pos, name in enumerate(header):
+        key = str(name).strip()
+        if key in SOURCE_COLUMNS and key not in seen:
+            keep.append((pos, name))
+            seen.add(key)
+    names = [name for _, name in keep]
+    while True:
+        batch = list(islice(rows, chunksize))
+        if not batch:
+            return
+        data = [[row[pos] if pos < len(row) else "" for pos, _ in keep] for row in batch]
+        yield TextParser(data, names=names, header=None, skip_blank_lines=False, dtype=dtype).read()
+
+
+def _raw_chunks(src, filename, chunksize, dtype=None):
+    if hasattr(src, "seek"):
+        src.seek(0)
+    if _is_csv(src, filename):
+        return pd.read_csv(src, usecols=_is_source_column, encoding="utf-8-sig", chunksize=chunksize, dtype=dtype)
+    return _excel_chunks(src, chunksize, dtype)
+
+
+def _merge_dtypes(dtypes, has_null, mixed):
+    """
+    نوع ستونی که pandas برای کل فایل انتخاب می‌کرد، از روی نوع تکه‌ها.
+
+    mixed نوع ستون ناهمگن است: در اکسل object (مقادیر خام) و در CSV متن.
+    """
+    if not dtypes:
+        return None
+    if all(is_numeric_dtype(d) and not is_bool_dtype(d) for d in dtypes):
+        if has_null or any(d.kind == "f" for d in dtypes):
+            return np.dtype(float)
+        return np.dtype("int64")
+    if len(dtypes) == 1:
+        dtype = next(iter(dtypes))
+        return mixed if is_bool_dtype(dtype) and has_null else dtype
+    return mixed
+
+
+def iter_tankhah(src, filename=None, chunksize=STREAM_CHUNK_ROWS):
+    """
+    خواندن تنبل فایل تنخواه به صورت دیتافریم‌های chunksize ردیفی.
+
+    نوع هر ستون در pandas به کل ستون بستگی دارد (مثلاً عدد صحیح کنار خانه
+    خالی float می‌شود و «5» به «5.0» تبدیل می‌شود). برای اینکه تکه‌ها دقیقاً
+    همان مقادیر read_tankhah را داشته باشند، فایل دو بار خوانده می‌شود: بار
+    اول فقط نوع نهایی ستون‌ها تعیین می‌شود و بار دوم تکه‌ها با همان نوع
+    برگردانده می‌شوند. حافظه در هر دو گذر به اندازه یک تکه است.
+    """
+    dtypes, nulls = {}, {}
+    for chunk in _raw_chunks(src, filename, chunksize):
+        for col in chunk.columns:
+            present = chunk[col].notna()
+            kinds = dtypes.setdefault(col, set())
+            if present.any():
+                kinds.add(chunk[col].dtype)
+            if not present.all():
+                nulls[col] = True
+    mixed = pd.StringDtype(na_value=np.nan) if _is_csv(src, filename) else np.dtype(object)
+    final = {col: _merge_dtypes(kinds, nulls.get(col, False), mixed) for col, kinds in dtypes.items()}
+
+    # ستون‌های ناهمگن باید بدون تبدیل عددی خوانده شوند
+    as_text = {col: dtype for col, dtype in final.items() if dtype == mixed}
+    for chunk in _raw_chunks(src, filename, chunksize, as_text or None):
+        for col, dtype in final.items():
+            if dtype is not None and chunk[col].dtype != dtype:
+                chunk[col] = chunk[col].astype(dtype)
+        yield chunk
+
+
+def _timed_chunks(chunks, metrics):
+    """ثبت زمان خواندن هر تکه در مرحله read."""
+    chunks = iter(chunks)
+    while True:
+        metrics.begin("read")
+        chunk = next(chunks, None)
+        if chunk is None:
+            metrics.end("read")
+            return
+        metrics.end("read", len(chunk))
+        yield chunk
+
+
+def stream_file(src, header, out, template_path=TEMPLATE_PATH, filename=None,
+                chunksize=STREAM_CHUNK_ROWS, metrics=None, store=None, progress=None):
+    """
+    ساخت سند با حافظه ثابت: ورودی تکه‌تکه خوانده، سطرها همان‌جا ساخته و
+    مستقیم در out (مسیر یا فایل) نوشته می‌شود. خروجی تعداد سطرهای سند است.
+
+    خروجی همان process_file است؛ برای فایل‌های خیلی بزرگ (مثلاً تنخواه
+    تجمیعی یک‌ساله) که کل دیتافریم و کل سند در حافظه جا نمی‌شود. progress
+    مثل process_file است (کل ردیف‌ها از پیش معلوم نیست و None است).
+    """
+    with _stage(metrics, "template"):
+        get_template(template_path)
+    chunks = iter_tankhah(src, filename, chunksize)
+    if metrics is not None:
+        chunks = _timed_chunks(chunks, metrics)
+    counter = Progress(progress)
+    chunks = counter.frames(chunks)
+
+    started = time.perf_counter()
+    write_voucher(counter.count(iter_voucher_lines(chunks, header, metrics, store)), template_path, out)
+    n_lines = counter.lines
+    if metrics is not None:
+        # نوشتن در دل خواندن و ساختن انجام می‌شود؛ زمان خودش باقی‌مانده است
+        inner = sum(metrics.stages[name]["seconds"] for name in _BUILD_STAGES if name in metrics.stages)
+        metrics.add("write", time.perf_counter() - started - inner, n_lines)
+        metrics.info.update(rows=metrics.stages.get("read", {}).get("rows") or 0,
+                            lines=n_lines, chunk_rows=chunksize)
+    return n_lines
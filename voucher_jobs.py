@@ -0,0 +1,275 @@
+"""
+اجرای پس‌زمینه کارهای ساخت سند، با گزارش پیشرفت و امکان لغو.
+
+صفحه Streamlit هر فایل را به JobManager می‌دهد و فوراً برمی‌گردد؛ کار در یک
+پروسه جدا اجرا می‌شود و پس از هر تکه ورودی تعداد ردیف‌های پردازش‌شده و
+سطرهای ساخته‌شده را گزارش می‌دهد. JobManager بین اجراهای دوباره صفحه زنده
+می‌ماند، پس تغییر یک ویجت کار در حال اجرا را از نو شروع نمی‌کند و کاری با
+همان کلید (همان فایل، سربرگ و نسخه قوانین) نتیجه قبلی را برمی‌گرداند.
+
+موتور ساخت سند (pandas و openpyxl) فقط با اولین کار import می‌شود، پس
+صفحه‌ای که هنوز فایلی نگرفته یا فقط کلاینت سرویس است آن را بار نمی‌کند.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from voucher_store import STORE_PATH, get_store
+
+# وضعیت‌های یک کار
+QUEUED = "queued"
+RUNNING = "running"
+OK = "ok"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINISHED = (OK, ERROR, CANCELLED)
+
+# تعداد کارهای تمام‌شده‌ای که نتیجه‌شان نگه داشته می‌شود (قدیمی‌ترین‌ها حذف می‌شوند)
+KEEP_FINISHED = 32
+
+# متغیر محیطی تعداد پروسه‌های ساخت هر فایل (پیش‌فرض ۱)
+FILE_WORKERS_ENV = "TANKHAH_FILE_WORKERS"
+
+
+class JobCancelled(Exception):
+    """کار به درخواست کاربر لغو شد."""
+
+
+class QueueFull(Exception):
+    """همه پروسه‌ها مشغول‌اند و صف انتظار پر است؛ کار را بعداً دوباره بفرستید."""
+
+
+def file_workers_default():
+    """تعداد پروسه‌های ساخت هر فایل از TANKHAH_FILE_WORKERS؛ پیش‌فرض ۱."""
+    value = os.environ.get(FILE_WORKERS_ENV, "").strip()
+    return max(1, int(value)) if value.isdigit() else 1
+
+
+def job_key(data, name, header, template_path=None, store_path=STORE_PATH, digest=None):
+    """
+    کلید نتیجه: هش محتوای فایل، فیلدهای سربرگ و نسخه قوانین/قالب/اصلاح‌های
+    دستی کد معین. digest هش sha256 از پیش حساب‌شده data است (اگر باشد).
+    """
+    from voucher_engine import TEMPLATE_PATH, rules_version
+
+    return (
+        digest or hashlib.sha256(data).hexdigest(),
+        name,
+        tuple(sorted(header.items())),
+        rules_version(),
+        os.stat(template_path or TEMPLATE_PATH).st_mtime_ns,
+        get_store(store_path).version() if store_path else None,
+    )
+
+
+def _run(job_id, data, header, template_path, name, chunk_rows, store_path, workers, track_memory, progress,
+         cancelled):
+    """
+    اجرای یک کار در پروسه کارگر.
+
+    progress و cancelled دیکشنری‌های مشترک (multiprocessing.Manager) هستند؛
+    پیشرفت کار با کلید job_id در progress نوشته می‌شود و اگر job_id در
+    cancelled باشد کار در پایان تکه جاری متوقف می‌شود. خروجی (بایت‌ها، تعداد
+    سطر، معیارها، VoucherPreview سند).
+    """
+    from voucher_cli import run_job
+    from voucher_engine import STREAM_CHUNK_ROWS, TEMPLATE_PATH
+
+    if job_id in cancelled:
+        raise JobCancelled()
+    started = time.time()
+    progress[job_id] = {"status": RUNNING, "started": started, "rows": 0, "lines": 0, "total_rows": None}
+
+    def report(rows, lines, total_rows):
+        if job_id in cancelled:
+            raise JobCancelled()
+        progress[job_id] = {"status": RUNNING, "started": started, "rows": rows, "lines": lines,
+                            "total_rows": total_rows}
+
+    previews = []
+    data, n_lines, metrics = run_job(BytesIO(data), header, template_path or TEMPLATE_PATH, name,
+                                     chunk_rows=chunk_rows or STREAM_CHUNK_ROWS, store_path=store_path,
+                                     progress=report, workers=workers, track_memory=track_memory, preview=previews)
+    return data, n_lines, metrics, previews[0]
+
+
+class Job:
+    """یک کار ثبت‌شده؛ وضعیت آن از future و پیشرفت از دیکشنری مشترک خوانده می‌شود."""
+
+    def __init__(self, job_id, key, name, future, manager):
+        self.id = job_id
+        self.key = key
+        self.name = name
+        self.submitted = time.time()
+        self.finished = None
+        self._future = future
+        self._manager = manager
+        self._final = None
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        # آخرین پیشرفت نگه داشته و از دیکشنری مشترک پاک می‌شود
+        self._final = self._manager._pop(self.id)
+        self.finished = time.time()
+
+    @property
+    def status(self):
+        future = self._future
+        if future.cancelled():
+            return CANCELLED
+        if future.done():
+            exc = future.exception()
+            if exc is None:
+                return OK
+            return CANCELLED if isinstance(exc, JobCancelled) else ERROR
+        return self.progress()["status"]
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    def progress(self):
+        """{status, rows, lines, total_rows, seconds} تا این لحظه."""
+        state = self._final if self._future.done() else self._manager._peek(self.id)
+        state = dict(state or {"status": QUEUED, "rows": 0, "lines": 0, "total_rows": None})
+        started = state.pop("started", None)
+        if self._future.done():
+            state["status"] = self.status
+            if state["status"] == OK:
+                _, state["lines"], metrics = self.result()
+                state["rows"] = metrics.get("rows", state["rows"])
+        state["seconds"] = ((self.finished or time.time()) - started) if started else 0.0
+        return state
+
+    def result(self):
+        """(بایت‌ها، تعداد سطر، معیارها)؛ اگر کار تمام نشده منتظر می‌ماند."""
+        data, n_lines, metrics, _ = self._future.result()
+        return data, n_lines, metrics
+
+    def preview(self):
+        """VoucherPreview سند که در پروسه کارگر همراه سند ساخته شده است."""
+        return self._future.result()[3]
+
+    @property
+    def error(self):
+        if not self._future.done() or self._future.cancelled():
+            return ""
+        exc = self._future.exception()
+        return "" if exc is None or isinstance(exc, JobCancelled) else str(exc)
+
+    def cancel(self):
+        """لغو کار؛ کار در صف فوراً و کار در حال اجرا در پایان تکه جاری متوقف می‌شود."""
+        if not self._future.done() and not self._future.cancel():
+            self._manager._cancel(self.id)
+
+    def as_result(self):
+        """نتیجه به شکل خروجی voucher_cli.process_batch (برای batch_zip)."""
+        from voucher_cli import output_name
+
+        result = {"file": self.name, "output": output_name(self.name), "status": self.status,
+                  "lines": 0, "data": None, "metrics": None, "error": self.error}
+        if result["status"] == OK:
+            result["data"], result["lines"], result["metrics"] = self.result()
+        elif result["status"] == CANCELLED:
+            result["error"] = "لغو شد"
+        return result
+
+
+class JobManager:
+    """
+    صف کارهای پس‌زمینه روی یک process pool.
+
+    submit با کلید تکراری (اگر کار قبلی لغو نشده یا خطا نداده) همان کار قبلی
+    را برمی‌گرداند؛ از کارهای تمام‌شده فقط keep_finished تای آخر نگه داشته
+    می‌شود. با max_queued، اگر غیر از max_workers کار در حال اجرا بیش از
+    max_queued کار در صف باشد submit خطای QueueFull می‌دهد. track_memory حافظه
+    اوج مراحل هر کار را هم می‌سنجد (None: از TANKHAH_TRACK_MEMORY).
+
+    file_workers تعداد پروسه‌های ساخت هر فایل است (None: از
+    TANKHAH_FILE_WORKERS، پیش‌فرض ۱)؛ هر کار در حال اجرا این تعداد پروسه
+    دیگر می‌سازد، پس با max_workers کار هم‌زمان تا max_workers × file_workers
+    پروسه کار می‌کنند.
+    """
+
+    def __init__(self, max_workers=None, keep_finished=KEEP_FINISHED, max_queued=None, track_memory=None,
+                 file_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.keep_finished = keep_finished
+        self.max_queued = max_queued
+        self.track_memory = track_memory
+        self.file_workers = file_workers or file_workers_default()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._mp = multiprocessing.Manager()
+        self._progress = self._mp.dict()
+        self._cancelled = self._mp.dict()
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, name, data, header, template_path=None, chunk_rows=None, store_path=STORE_PATH,
+               workers=None):
+        """
+        ثبت کار برای بایت‌های data؛ workers پروسه‌های ساخت همین یک فایل است
+        (None: file_workers مدیر). template_path و chunk_rows خالی یعنی پیش‌فرض
+        موتور. خروجی Job.
+        """
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.status not in (ERROR, CANCELLED):
+                return job
+            if self.max_queued is not None and self._pending() >= self.max_workers + self.max_queued:
+                raise QueueFull()
+            job_id = uuid.uuid4().hex[:12]
+            future = self._pool.submit(_run, job_id, data, dict(header), template_path, name, chunk_rows,
+                                       store_path, workers or self.file_workers, self.track_memory, self._progress, self._cancelled)
+            job = Job(job_id, key, name, future, self)
+            self._jobs[job_id] = job
+            self._by_key[key] = job
+            self._evict()
+            return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        # نخ‌های سرویس هم‌زمان submit می‌کنند؛ پیمایش _jobs فقط زیر قفل
+        with self._lock:
+            return list(self._jobs.values())
+
+    def pending(self):
+        """تعداد کارهای تمام‌نشده (در حال اجرا یا در صف)."""
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        # فقط زیر self._lock
+        return sum(not job.done for job in self._jobs.values())
+
+    def _evict(self):
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def _peek(self, job_id):
+        return self._progress.get(job_id)
+
+    def _pop(self, job_id):
+        self._cancelled.pop(job_id, None)
+        return self._progress.pop(job_id, None)
+
+    def _cancel(self, job_id):
+        self._cancelled[job_id] = True
+
+    def shutdown(self):
+        for job in self.jobs():
+            job.cancel()
+        self._pool.shutdown(wait=True)
+        self._mp.shutdown()
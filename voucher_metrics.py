@@ -0,0 +1,174 @@
+"""
+زمان‌سنجی و حافظه هر مرحله از یک کار ساخت سند.
+
+هر کار (یک فایل) یک JobMetrics دارد که برای هر مرحله (خواندن، قالب،
+نرمال‌سازی، حلقه، تشخیص کد معین، نوشتن) زمان، تعداد ردیف و حافظه را نگه
+می‌دارد و در پایان یک خط JSON در لاگ tankhah.metrics می‌نویسد.
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+logger = logging.getLogger("tankhah.metrics")
+
+# متغیر محیطی روشن کردن اندازه‌گیری حافظه اوج هر مرحله (tracemalloc) برای همه کارها
+TRACK_MEMORY_ENV = "TANKHAH_TRACK_MEMORY"
+
+# تعداد اجراهای اخیر صفحه که میانه زمان اجرا از آن‌ها حساب می‌شود
+PAGE_RUNS_KEPT = 50
+
+
+def track_memory_default():
+    """اندازه‌گیری حافظه اوج مراحل روشن است اگر TANKHAH_TRACK_MEMORY برابر 1 (یا true/yes) باشد."""
+    return os.environ.get(TRACK_MEMORY_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+def peak_rss_mb():
+    """
+    بیشترین حافظه مقیم پروسه از شروع آن تا این لحظه (مگابایت)؛ بدون resource صفر.
+
+    این عدد هیچ‌وقت پایین نمی‌آید، پس در پروسه کارگری که چند کار را پشت‌سرهم
+    اجرا کرده حافظه کارهای قبلی را هم دارد.
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # لینوکس کیلوبایت و مک بایت برمی‌گرداند
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class JobMetrics:
+    """
+    اندازه‌گیری مرحله‌به‌مرحله یک کار.
+
+    حافظه اوج هر مرحله (peak_mb) با tracemalloc فقط وقتی track_memory روشن
+    باشد اندازه گرفته می‌شود (کار را چند برابر کند می‌کند)؛ track_memory=None
+    یعنی از متغیر محیطی TANKHAH_TRACK_MEMORY. process_peak_rss_mb هر مرحله
+    همیشه ثبت می‌شود ولی اوج کل عمر پروسه است، نه حافظه همان مرحله.
+    """
+
+    def __init__(self, job=None, track_memory=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.job = job
+        self.track_memory = track_memory_default() if track_memory is None else track_memory
+        self.stages = {}
+        self.info = {}
+        self._open = {}
+        # اوج حافظه هر مرحله باز پیش از آخرین reset_peak (مرحله تودرتو اوج را صفر می‌کند)
+        self._peaks = {}
+        self._own_trace = False
+        self._started = time.perf_counter()
+
+    def begin(self, name):
+        """شروع یک مرحله؛ با end(name) بسته می‌شود."""
+        if self.track_memory:
+            if tracemalloc.is_tracing():
+                # اوج تا اینجا مال مراحل بیرونی است و پیش از صفر شدن نگه داشته می‌شود
+                peak = tracemalloc.get_traced_memory()[1]
+                for outer in self._open:
+                    self._peaks[outer] = max(self._peaks.get(outer, 0), peak)
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                self._own_trace = True
+            self._peaks[name] = 0
+        self._open[name] = time.perf_counter()
+
+    def end(self, name, rows=None):
+        """پایان مرحله name و ثبت زمان، تعداد ردیف و حافظه اوج آن."""
+        seconds = time.perf_counter() - self._open.pop(name)
+        peak = None
+        if self.track_memory and tracemalloc.is_tracing():
+            peak = max(self._peaks.pop(name, 0), tracemalloc.get_traced_memory()[1]) / 2**20
+            if self._own_trace and not self._open:
+                tracemalloc.stop()
+                self._own_trace = False
+        self.add(name, seconds, rows, peak)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """زمان‌سنجی یک مرحله؛ rows تعداد ردیف/سطری است که مرحله پردازش کرده."""
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name, rows)
+
+    def add(self, name, seconds, rows=None, peak_mb=None):
+        """ثبت (یا افزودن به) یک مرحله که جدا اندازه گرفته شده است."""
+        st = self.stages.setdefault(name, {"seconds": 0.0, "rows": None, "peak_mb": None})
+        st["seconds"] += seconds
+        if rows is not None:
+            st["rows"] = (st["rows"] or 0) + rows
+        if peak_mb is not None:
+            st["peak_mb"] = max(st["peak_mb"] or 0.0, peak_mb)
+        st["process_peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    def as_dict(self):
+        return {
+            "job_id": self.job_id,
+            "job": self.job,
+            "total_seconds": round(time.perf_counter() - self._started, 4),
+            **self.info,
+            "stages": {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in st.items()}
+                for name, st in self.stages.items()
+            },
+        }
+
+    def log(self):
+        """یک خط JSON برای کل کار در لاگ tankhah.metrics."""
+        logger.info(json.dumps(self.as_dict(), ensure_ascii=False))
+
+
+def setup_metrics_logging(stream=None):
+    """خروجی JSON لاگ معیارها روی stderr (فقط یک بار)."""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+# ------------------------------------------------------------
+# زمان اجراهای صفحه
+# ------------------------------------------------------------
+# اجراهای کامل صفحه Streamlit در این پروسه (همه نشست‌ها)؛ app.py زمان شروع را
+# پیش از importهایش می‌گیرد، پس اجرای اول (شروع سرد) هزینه import streamlit و
+# ماژول‌های صفحه را هم دارد
+_page_runs = {"cold": None, "count": 0, "recent": deque(maxlen=PAGE_RUNS_KEPT)}
+_page_lock = threading.Lock()
+
+
+def record_page_run(seconds):
+    """
+    ثبت زمان یک اجرای کامل صفحه؛ خروجی {cold, last, median, runs} به ثانیه.
+
+    cold زمان اولین اجرای صفحه در پروسه و median میانه اجراهای بعدی (هزینه
+    هر تعامل) است. اجرای اول در لاگ tankhah.metrics هم نوشته می‌شود.
+    """
+    with _page_lock:
+        runs = _page_runs
+        runs["count"] += 1
+        if runs["cold"] is None:
+            runs["cold"] = seconds
+            logger.info(json.dumps({"page": "cold_start", "seconds": round(seconds, 4),
+                                    "process_peak_rss_mb": round(peak_rss_mb(), 1)}))
+        else:
+            runs["recent"].append(seconds)
+        return {"cold": runs["cold"], "last": seconds,
+                "median": statistics.median(runs["recent"]) if runs["recent"] else None, "runs": runs["count"]}
@@ -0,0 +1,115 @@
+"""
+پیش‌نمایش صفحه‌به‌صفحه سطرهای سند.
+
+جدول سطرها (کد معین، شرح، بدهکار، بستانکار و ناحیه/گروه ردیف مبدأ) یک بار
+ساخته و جمع بدهکار و بستانکار هر کد معین از پیش حساب می‌شود. صفحه فقط
+فیلتر و برش همین جدول را نشان می‌دهد، پس با سند چند هزار سطری هم فقط
+سطرهای یک صفحه به مرورگر فرستاده می‌شود.
+
+پیش‌نمایش هر کار در همان پروسه کارگری ساخته می‌شود که سند را می‌سازد
+(process_file با preview) و همراه نتیجه کار برمی‌گردد؛ صفحه سند را دوباره
+نمی‌سازد. سرویس (voucher_service) فقط view یک صفحه را می‌فرستد.
+"""
+import numpy as np
+import pandas as pd
+
+from voucher_engine import (
+    VoucherLine, find_group_col, is_almasi_tanakh, normalize_frame, settlement_keys, voucher_totals,
+)
+
+# تعداد سطر هر صفحه
+PAGE_ROWS = 100
+
+
+def row_labels(df, tanakh_name):
+    """
+    ناحیه و شماره گروه هر ردیف ورودی.
+
+    گروه شماره دنباله ناحیه (الماسی) یا پرداخت جمعی است که ردیف در آن
+    است، از 1؛ ردیف بیرون از دنباله 0 است.
+    """
+    named = df.rename(columns=lambda c: str(c).strip())
+    norm = normalize_frame(named[[c for c in ("ناحیه", find_group_col(named.columns)) if c in named.columns]])
+    keys = settlement_keys(norm, is_almasi_tanakh(tanakh_name))
+    area = norm["area"].to_numpy()
+    area = np.where(area == "nan", "", area)
+    inside = pd.notna(keys)
+    starts = inside.copy()
+    starts[1:] &= ~inside[:-1] | (keys[1:] != keys[:-1])
+    return area, np.where(inside, np.cumsum(starts), 0)
+
+
+def account_totals(frame):
+    """جمع بدهکار، بستانکار و تعداد سطر هر کد معین (voucher_totals روی سطرهای frame)."""
+    totals = voucher_totals(frame[["account", "debit", "credit"]].itertuples(index=False))
+    return pd.DataFrame(
+        [(code, *totals[code]) for code in sorted(totals)], columns=["account", "debit", "credit", "lines"]
+    ).set_index("account")
+
+
+class VoucherPreview:
+    """
+    جدول سطرهای یک سند برای پیش‌نمایش.
+
+    lines فهرست VoucherLine یا مقادیر سطرها (build_voucher_parallel) و origins
+    شماره ردیف df هر سطر است (iter_voucher_lines). frame یک سطر به
+    ازای هر سطر سند دارد و شماره آن همان شماره سطر در اکسل خروجی است؛
+    ستون row شماره سطر ردیف مبدأ در اکسل ورودی است. totals جمع هر کد معین
+    کل سند است.
+    """
+
+    def __init__(self, lines, origins, df, tanakh_name):
+        if lines and not isinstance(lines[0], VoucherLine):
+            lines = [VoucherLine.from_values(values) for values in lines]
+        area, group = row_labels(df, tanakh_name)
+        rows = np.asarray(origins, dtype=int)
+        index = pd.RangeIndex(2, len(lines) + 2)
+        self.frame = pd.DataFrame(
+            {
+                "account": [line.account for line in lines],
+                # object: تبدیل ده‌ها هزار شرح به رشته arrow گران است و فقط یک صفحه نمایش داده می‌شود
+                "description": pd.Series([line.description for line in lines], index=index, dtype=object),
+                "debit": np.array([line.debit or 0.0 for line in lines], dtype=float),
+                "credit": np.array([line.credit or 0.0 for line in lines], dtype=float),
+                "area": pd.Series(area[rows], index=index, dtype=object),
+                "group": group[rows],
+                "row": rows + 2,
+            },
+            index=index,
+        )
+        self.totals = account_totals(self.frame)
+        self.accounts = self.totals.index.tolist()
+        self.areas = sorted(set(area) - {""}, key=lambda a: (len(a), a))
+        self.groups = int(group.max()) if len(group) else 0
+
+    def filter(self, accounts=(), areas=(), group=0):
+        """سطرهای کدهای معین accounts، ناحیه‌های areas و گروه group (خالی و 0 یعنی همه)."""
+        frame = self.frame
+        mask = np.ones(len(frame), dtype=bool)
+        if accounts:
+            mask &= frame["account"].isin(accounts).to_numpy()
+        if areas:
+            mask &= frame["area"].isin(areas).to_numpy()
+        if group:
+            mask &= frame["group"].to_numpy() == group
+        return frame if mask.all() else frame[mask]
+
+    @staticmethod
+    def pages(frame, page_rows=PAGE_ROWS):
+        return max(1, -(-len(frame) // page_rows))
+
+    @staticmethod
+    def page(frame, number, page_rows=PAGE_ROWS):
+        """صفحه number (از 1) از frame."""
+        return frame.iloc[(number - 1) * page_rows:number * page_rows]
+
+    def view(self, accounts=(), areas=(), group=0, number=1):
+        """
+        آنچه صفحه نشان می‌دهد برای یک فیلتر: {lines, totals, pages, page}؛
+        تعداد سطرها، جمع هر کد معین، تعداد صفحه‌ها و سطرهای صفحه number (اگر
+        بیشتر از تعداد صفحه‌ها باشد، صفحه آخر).
+        """
+        frame = self.filter(accounts, areas, group)
+        pages = self.pages(frame)
+        return {"lines": len(frame), "totals": self.totals if frame is self.frame else account_totals(frame),
+                "pages": pages, "page": self.page(frame, min(number, pages))}
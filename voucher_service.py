@@ -0,0 +1,255 @@
+"""
+سرویس HTTP محلی ساخت سند، جدا از صفحه Streamlit.
+
+کارها روی یک JobManager با تعداد پروسه محدود اجرا می‌شوند؛ اگر همه پروسه‌ها
+مشغول و صف انتظار (--max-queue) پر باشد درخواست تازه با 429 و Retry-After
+رد می‌شود تا فرستنده بعداً دوباره بفرستد. صفحه Streamlit با متغیر محیطی
+TANKHAH_SERVICE_URL فقط کلاینت این سرویس است (voucher_client) و سامانه‌های
+دیگر هم می‌توانند مستقیم فایل بفرستند.
+
+نمونه:
+    python voucher_service.py --port 8502 --workers 4 --max-queue 8
+    curl -X POST --data-binary @تنخواه.xlsx \\
+        "http://127.0.0.1:8502/jobs?name=t.xlsx&tanakh_number=12&tanakh_name=...&date_input=1403/03/12&project_name=...&sath4_default=5021&sath5_default=7"
+    curl http://127.0.0.1:8502/jobs/<id>
+    curl -o سند.xlsx http://127.0.0.1:8502/jobs/<id>/result
+    curl "http://127.0.0.1:8502/jobs/<id>/preview?page=2"
+    curl -X DELETE http://127.0.0.1:8502/jobs/<id>
+
+مسیرها:
+    POST   /jobs?name=...&<فیلدهای سربرگ>   بدنه: بایت‌های فایل؛ 202 و وضعیت کار
+    GET    /jobs/<id>                       وضعیت و پیشرفت (و معیارها پس از پایان)
+    GET    /jobs/<id>/result                فایل سند؛ 409 اگر کار هنوز موفق تمام نشده
+    GET    /jobs/<id>/preview?page=2&account=7350&area=3&group=0
+                                            یک صفحه پیش‌نمایش سند (voucher_preview) و جمع هر کد معین
+    DELETE /jobs/<id>                       لغو کار
+    GET    /health                          تعداد پروسه‌ها و کارهای در جریان
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from voucher_cli import INPUT_SUFFIXES, output_name
+from voucher_engine import HEADER_FIELDS, TEMPLATE_PATH, check_header
+from voucher_jobs import OK, JobManager, QueueFull, job_key
+from voucher_metrics import setup_metrics_logging
+from voucher_store import STORE_PATH
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8502
+
+# بزرگ‌ترین فایل پذیرفتنی (بایت)
+MAX_UPLOAD_BYTES = 200 * 2**20
+
+# ثانیه‌های پیشنهادی تا فرستادن دوباره وقتی صف پر است
+RETRY_AFTER = 5
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+logger = logging.getLogger("tankhah.service")
+
+
+def job_state(job):
+    """وضعیت یک کار به شکل JSON پاسخ‌ها؛ معیارهای مراحل فقط پس از پایان موفق."""
+    state = job.progress()
+    state.update(id=job.id, name=job.name, error=job.error)
+    if state["status"] == OK:
+        state["metrics"] = job.result()[2]
+    return state
+
+
+def preview_view(preview, query):
+    """
+    یک صفحه پیش‌نمایش به شکل JSON (VoucherPreview.view)؛ فیلترها از پارامترهای
+    تکراری account و area و group و شماره صفحه از page. جدول‌ها به شکل
+    orient="split" در pandas است.
+    """
+    view = preview.view([int(code) for code in query.get("account", [])], query.get("area", []),
+                        int(query.get("group", ["0"])[0]), max(1, int(query.get("page", ["1"])[0])))
+    return {
+        "accounts": preview.accounts,
+        "areas": preview.areas,
+        "groups": preview.groups,
+        "lines": view["lines"],
+        "pages": view["pages"],
+        "totals": json.loads(view["totals"].to_json(orient="split")),
+        "page": json.loads(view["page"].to_json(orient="split", force_ascii=False)),
+    }
+
+
+class VoucherService(ThreadingHTTPServer):
+    """سرور HTTP روی یک JobManager؛ هر درخواست در یک نخ جدا پاسخ داده می‌شود."""
+
+    daemon_threads = True
+
+    def __init__(self, address, manager, template_path=TEMPLATE_PATH, store_path=STORE_PATH,
+                 max_upload=MAX_UPLOAD_BYTES):
+        super().__init__(address, ServiceHandler)
+        self.manager = manager
+        self.template_path = template_path
+        self.store_path = store_path
+        self.max_upload = max_upload
+
+    def health(self):
+        manager = self.manager
+        return {"workers": manager.max_workers, "max_queued": manager.max_queued, "pending": manager.pending(),
+                "jobs": len(manager.jobs())}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "tankhah-voucher/1"
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def log_message(self, format, *args):
+        logger.info("%s " + format, self.address_string(), *args)
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            if parts == ["health"] and method == "GET":
+                return self._json(200, self.server.health())
+            if parts == ["jobs"] and method == "POST":
+                return self._submit(parse_qs(url.query))
+            if len(parts) in (2, 3) and parts[0] == "jobs":
+                job = self.server.manager.get(parts[1])
+                if job is None:
+                    return self._json(404, {"error": "کار پیدا نشد"})
+                if method == "GET" and len(parts) == 2:
+                    return self._json(200, job_state(job))
+                if method == "GET" and parts[2] == "result":
+                    return self._result(job)
+                if method == "GET" and parts[2] == "preview":
+                    return self._preview(job, parse_qs(url.query))
+                if method == "DELETE" and len(parts) == 2:
+                    job.cancel()
+                    return self._json(202, job_state(job))
+            self._json(404, {"error": "مسیر نامعتبر"})
+        except Exception as e:
+            logger.exception("خطا در پاسخ به %s %s", method, self.path)
+            self._json(500, {"error": str(e)})
+
+    def _submit(self, query):
+        """
+        ثبت کار برای بدنه درخواست؛ سربرگ و نام فایل از پارامترهای آدرس.
+
+        درخواست نامعتبر با 400 رد می‌شود حتی اگر صف پر باشد. فایلی که کارش
+        پیش‌تر ثبت شده (همان کلید) همان کار را می‌گیرد و فقط کار تازه با صف پر
+        429 می‌گیرد (JobManager.submit).
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.max_upload:
+            self.close_connection = True
+            return self._json(413, {"error": f"فایل بزرگ‌تر از {self.server.max_upload // 2**20} مگابایت است"})
+        name = query.get("name", [""])[0].strip()
+        header = {f: query.get(f, [""])[0] for f in HEADER_FIELDS}
+        error = None
+        if not name.lower().endswith(INPUT_SUFFIXES):
+            error = "پارامتر name باید نام فایل xlsx یا csv باشد"
+        elif not length:
+            error = "بدنه درخواست (فایل تنخواه) خالی است"
+        else:
+            try:
+                check_header(header)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            # بدنه بدون نگه داشتن در حافظه دور ریخته می‌شود تا فرستنده پاسخ را بگیرد
+            self._discard(length)
+            return self._json(400, {"error": error})
+
+        data = self.rfile.read(length)
+        server = self.server
+        try:
+            job = server.manager.submit(job_key(data, name, header, server.template_path, server.store_path), name,
+                                        data, header, server.template_path, store_path=server.store_path)
+        except QueueFull:
+            return self._busy()
+        self._json(202, job_state(job))
+
+    def _discard(self, length):
+        while length > 0:
+            chunk = self.rfile.read(min(length, 2**20))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _busy(self):
+        self._json(429, {"error": "سرویس مشغول است؛ بعداً دوباره بفرستید", "retry_after": RETRY_AFTER},
+                   {"Retry-After": str(RETRY_AFTER)})
+
+    def _result(self, job):
+        if job.status != OK:
+            return self._json(409, job_state(job))
+        data = job.result()[0]
+        self._send(200, data, XLSX_MIME,
+                   {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(output_name(job.name))}"})
+
+    def _preview(self, job, query):
+        if job.status != OK:
+            return self._json(409, job_state(job))
+        try:
+            body = preview_view(job.preview(), query)
+        except ValueError:
+            return self._json(400, {"error": "پارامترهای account، group و page باید عدد باشند"})
+        self._json(200, body)
+
+    def _json(self, status, body, headers=None):
+        self._send(status, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8",
+                   headers)
+
+    def _send(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="سرویس HTTP ساخت سند حسابداری تنخواه")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="تعداد کارهای هم‌زمان")
+    parser.add_argument("--max-queue", type=int, default=16, help="حداکثر کار منتظر؛ بیشتر از آن با 429 رد می‌شود")
+    parser.add_argument("--file-workers", type=int,
+                        help="تعداد پروسه‌های ساخت هر فایل بزرگ (پیش‌فرض TANKHAH_FILE_WORKERS یا ۱)")
+    parser.add_argument("--template", default=TEMPLATE_PATH)
+    parser.add_argument("--store", default=STORE_PATH, help="فایل SQLite اصلاح‌های دستی و حافظه کد معین")
+    parser.add_argument("--no-store", action="store_true", help="کد معین فقط از روی قوانین")
+    parser.add_argument("--track-memory", action="store_true", default=None,
+                        help="حافظه اوج هر مرحله را هم با tracemalloc بسنج (کندتر؛ مثل TANKHAH_TRACK_MEMORY=1)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    setup_metrics_logging()
+    manager = JobManager(args.workers, max_queued=args.max_queue, track_memory=args.track_memory,
+                         file_workers=args.file_workers)
+    server = VoucherService((args.host, args.port), manager, args.template, None if args.no_store else args.store)
+    logger.info("سرویس روی http://%s:%d (%d پروسه، صف %d)", args.host, args.port, manager.max_workers, args.max_queue)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+حافظه ماندگار تشخیص کد معین (SQLite محلی).
+
+دو جدول دارد:
+- overrides: اصلاح دستی حسابدار برای یک شرح (با دامنه دفتر/پروژه یا همه)؛
+  همیشه بر تشخیص کلیدواژه‌ای مقدم است.
+- learned: نتیجه تشخیص کلیدواژه‌ای هر شرح برای یک نسخه قوانین؛ شرح‌های
+  تکراری ماه‌های بعد بدون اجرای دوباره قوانین پیدا می‌شوند و با عوض شدن
+  rules.json خودبه‌خود کنار گذاشته می‌شوند.
+
+نمونه:
+    python voucher_store.py set "خرید آب معدنی" 7204 --scope office --note "پذیرایی است نه قبض آب"
+    python voucher_store.py list
+    python voucher_store.py remove "خرید آب معدنی" --scope office
+    python voucher_store.py import اصلاحات.csv      # ستون‌های desc, code و (اختیاری) scope, note
+"""
+import argparse
+import csv
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from voucher_text import TEXT_NORMALIZATION_VERSION, normalize_text
+
+STORE_PATH = "accounts.sqlite3"
+
+# دامنه اصلاح دستی: "" برای همه، یا فقط دفتر مرکزی / پروژه
+SCOPES = ("", "office", "project")
+
+# حداکثر پارامتر هر پرس‌وجوی IN
+_QUERY_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS overrides (
+    desc_key    TEXT NOT NULL,
+    scope       TEXT NOT NULL DEFAULT '',
+    code        INTEGER NOT NULL,
+    description TEXT,
+    note        TEXT,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (desc_key, scope)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS learned (
+    desc_key      TEXT NOT NULL,
+    scope         TEXT NOT NULL,
+    rules_version TEXT NOT NULL,
+    code          INTEGER NOT NULL,
+    PRIMARY KEY (desc_key, scope, rules_version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('revision', 0);
+CREATE TABLE IF NOT EXISTS learned_version (
+    rules_version TEXT NOT NULL
+);
+"""
+
+# خطاهای قفل/مشغول بودن پایگاه (SQLITE_BUSY و SQLITE_LOCKED)
+_BUSY_CODES = (5, 6)
+
+
+def override_key(desc):
+    """کلید اصلاح دستی: شرح یکسان‌شده (voucher_text) بدون فاصله دو سر."""
+    return normalize_text(str(desc)).strip()
+
+
+def learned_key(desc):
+    """کلید نتیجه تشخیص: همان متنی که کلیدواژه‌ها در آن جست‌وجو می‌شوند."""
+    return normalize_text(desc)
+
+
+def _batches(items):
+    items = list(items)
+    for i in range(0, len(items), _QUERY_BATCH):
+        yield items[i:i + _QUERY_BATCH]
+
+
+class AccountStore:
+    """
+    دسترسی به فایل SQLite حافظه تشخیص.
+
+    هر عمل یک اتصال کوتاه باز می‌کند، پس یک شیء بین نخ‌های Streamlit و
+    پروسه‌های اجرای دسته‌ای بی‌خطر است.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            _rekey_overrides(conn)
+
+    @contextmanager
+    def _connect(self):
+        """اتصال کوتاه؛ در پایان commit (یا rollback) و بسته می‌شود."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --------------------------------------------------------
+    # تشخیص
+    # --------------------------------------------------------
+    def lookup(self, descs, is_office, is_exception_holder, rules_version):
+        """
+        کد معین شرح‌هایی که در حافظه هست: {شرح: (کد, منبع)}.
+
+        منبع "override" یا "learned" است. اصلاح با دامنه دقیق بر اصلاح
+        عمومی (scope خالی) مقدم است.
+        """
+        scope = "office" if is_office else "project"
+        found = {}
+        keys = {}
+        for desc in descs:
+            keys.setdefault(override_key(desc), []).append(desc)
+        with self._connect() as conn:
+            for batch in _batches(keys):
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT desc_key, code FROM overrides WHERE scope IN ('', ?) AND desc_key IN ({marks})"
+                    " ORDER BY scope",  # '' اول؛ دامنه دقیق روی آن می‌نشیند
+                    [scope, *batch],
+                )
+                for key, code in rows:
+                    for desc in keys[key]:
+                        found[desc] = (code, "override")
+
+            learned_scope = _learned_scope(is_office, is_exception_holder)
+            rest = {}
+            for desc in descs:
+                if desc not in found:
+                    rest.setdefault(learned_key(desc), []).append(desc)
+            for batch in _batches(rest):
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT desc_key, code FROM learned WHERE scope = ? AND rules_version = ?"
+                    f" AND desc_key IN ({marks})",
+                    [learned_scope, rules_version, *batch],
+                )
+                for key, code in rows:
+                    for desc in rest[key]:
+                        found[desc] = (code, "learned")
+        return found
+
+    def remember(self, codes, is_office, is_exception_holder, rules_version):
+        """ثبت نتیجه تشخیص کلیدواژه‌ای {شرح: کد}؛ اگر پایگاه قفل باشد بی‌صدا رد می‌شود."""
+        if not codes:
+            return
+        scope = _learned_scope(is_office, is_exception_holder)
+        try:
+            with self._connect() as conn:
+                _prune_learned(conn, rules_version)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO learned (desc_key, scope, rules_version, code) VALUES (?, ?, ?, ?)",
+                    [(learned_key(desc), scope, rules_version, int(code)) for desc, code in codes.items()],
+                )
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+
+    # --------------------------------------------------------
+    # اصلاح دستی
+    # --------------------------------------------------------
+    def set_override(self, desc, code, scope="", note=""):
+        if scope not in SCOPES:
+            raise ValueError(f"دامنه نامعتبر: {scope}")
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO overrides (desc_key, scope, code, description, note, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (override_key(desc), scope, int(code), str(desc).strip(), note,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+            _bump_revision(conn)
+
+    def remove_override(self, desc, scope=""):
+        """حذف اصلاح؛ خروجی True اگر چیزی حذف شد."""
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM overrides WHERE desc_key = ? AND scope = ?", (override_key(desc), scope))
+            removed = cur.rowcount > 0
+            # حذف اصلاحی که نبود نسخه را عوض نمی‌کند تا کارهای ذخیره‌شده (job_key) معتبر بمانند
+            if removed:
+                _bump_revision(conn)
+        return removed
+
+    def overrides(self):
+        """همه اصلاح‌ها به صورت فهرست دیکشنری."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT description, scope, code, note, updated_at FROM overrides ORDER BY desc_key, scope"
+            )
+            return [dict(row) for row in rows]
+
+    def version(self):
+        """شماره بازنگری اصلاح‌ها؛ با هر ثبت یا حذف یکی زیاد می‌شود (برای کلید کش نتیجه‌ها)."""
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE name = 'revision'").fetchone()[0]
+
+
+def _bump_revision(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'revision'")
+
+
+def _rekey_overrides(conn):
+    """
+    ساخت دوباره کلید اصلاح‌ها از متن ثبت‌شده آن‌ها، وقتی قواعد یکسان‌سازی
+    (TEXT_NORMALIZATION_VERSION) از آخرین باز شدن پایگاه عوض شده باشد.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE name = 'text_version'").fetchone()
+    if row is not None and row[0] == TEXT_NORMALIZATION_VERSION:
+        return
+    rows = conn.execute(
+        "SELECT desc_key, scope, code, description, note, updated_at FROM overrides ORDER BY updated_at"
+    ).fetchall()
+    if rows:
+        conn.execute("DELETE FROM overrides")
+        # دو اصلاح که حالا یک کلید دارند: جدیدتر می‌ماند
+        conn.executemany(
+            "INSERT OR REPLACE INTO overrides (desc_key, scope, code, description, note, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(override_key(description or key), scope, code, description, note, updated_at)
+             for key, scope, code, description, note, updated_at in rows],
+        )
+        _bump_revision(conn)
+    conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('text_version', ?)", (TEXT_NORMALIZATION_VERSION,))
+
+
+def _prune_learned(conn, rules_version):
+    """
+    حذف نتیجه‌های نسخه‌های قبلی قوانین، فقط وقتی rules_version از آخرین
+    ثبت عوض شده باشد (نسخه ثبت‌شده در جدول learned_version است).
+    """
+    row = conn.execute("SELECT rules_version FROM learned_version").fetchone()
+    if row is not None and row[0] == rules_version:
+        return
+    conn.execute("DELETE FROM learned WHERE rules_version != ?", (rules_version,))
+    conn.execute("DELETE FROM learned_version")
+    conn.execute("INSERT INTO learned_version (rules_version) VALUES (?)", (rules_version,))
+
+
+def _is_busy(error):
+    """آیا خطای SQLite از قفل بودن پایگاه به دست پروسه دیگر است؟"""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in _BUSY_CODES
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _learned_scope(is_office, is_exception_holder):
+    return ("office" if is_office else "project") + ("+exception" if is_exception_holder else "")
+
+
+# یک شیء برای هر مسیر در هر پروسه
+_stores = {}
+
+
+def get_store(path=STORE_PATH):
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = AccountStore(path)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="مدیریت اصلاح‌های دستی کد معین")
+    parser.add_argument("--store", default=STORE_PATH, help="مسیر فایل SQLite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_set = sub.add_parser("set", help="ثبت یا تغییر اصلاح یک شرح")
+    p_set.add_argument("desc")
+    p_set.add_argument("code", type=int)
+    p_set.add_argument("--scope", choices=SCOPES, default="")
+    p_set.add_argument("--note", default="")
+    p_rm = sub.add_parser("remove", help="حذف اصلاح یک شرح")
+    p_rm.add_argument("desc")
+    p_rm.add_argument("--scope", choices=SCOPES, default="")
+    sub.add_parser("list", help="فهرست اصلاح‌ها")
+    p_imp = sub.add_parser("import", help="ثبت اصلاح‌ها از CSV (ستون‌های desc, code, scope, note)")
+    p_imp.add_argument("csv_path")
+    args = parser.parse_args(argv)
+
+    store = AccountStore(args.store)
+    if args.command == "set":
+        store.set_override(args.desc, args.code, args.scope, args.note)
+    elif args.command == "remove":
+        if not store.remove_override(args.desc, args.scope):
+            print("اصلاحی برای این شرح نبود", file=sys.stderr)
+            return 1
+    elif args.command == "list":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["desc", "scope", "code", "note", "updated_at"])
+        for row in store.overrides():
+            writer.writerow([row["description"], row["scope"], row["code"], row["note"], row["updated_at"]])
+    elif args.command == "import":
+        with open(args.csv_path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            store.set_override(row["desc"], int(row["code"]), (row.get("scope") or "").strip(), row.get("note") or "")
+        print(f"{len(rows)} اصلاح ثبت شد")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+یکسان‌سازی متن فارسی برای مقایسه نام‌ها، شرح‌ها و کلیدواژه‌ها.
+
+فایل‌های تنخواه از صفحه‌کلیدهای مختلف می‌آیند: ي/ی و ك/ک عربی و فارسی،
+نیم‌فاصله، اعراب و کشیده و فاصله‌های چندتایی یک کلمه را به چند شکل
+درمی‌آورند. normalize_text همه را به یک شکل می‌برد و name_key برای نام
+تنخواه‌دار آ را هم ا می‌کند («آقای ویسی» و «اقای ویسی» یکی‌اند). هر دو برای
+هر رشته متمایز یک بار اجرا می‌شوند و نتیجه در حافظه می‌ماند.
+
+آ در شرح و کلیدواژه ا نمی‌شود: کلیدواژه «آب» نباید در «بابت» پیدا شود.
+"""
+import re
+from functools import lru_cache
+
+# تعداد رشته‌های متمایز نگه‌داشته‌شده در حافظه هر تابع
+TEXT_CACHE_SIZE = 16384
+
+# نسخه قواعد یکسان‌سازی؛ با هر تغییر جدول‌های زیر یکی زیاد شود تا نتیجه‌های
+# ذخیره‌شده بر پایه قواعد قبلی (نسخه قوانین، کلید حافظه کد معین) کنار گذاشته شوند
+TEXT_NORMALIZATION_VERSION = 1
+
+_CHAR_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی",
+    "ك": "ک",
+    "ۀ": "ه", "ة": "ه",
+    "أ": "ا", "إ": "ا", "ٱ": "ا",
+    **{d: str(i) for i, d in enumerate("۰۱۲۳۴۵۶۷۸۹")},
+    **{d: str(i) for i, d in enumerate("٠١٢٣٤٥٦٧٨٩")},
+    # نیم‌فاصله و اتصال‌دهنده صفرعرض مثل فاصله‌اند
+    "\u200c": " ", "\u200d": " ",
+    # علامت‌های جهت، BOM، کشیده، اعراب و همزه بالای حرف حذف می‌شوند
+    **dict.fromkeys(["\u200e", "\u200f", "\ufeff", "\u0640", "\u0654", "\u0655", "\u0670",
+                     *map(chr, range(0x064B, 0x0653))]),
+})
+
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def normalize_text(text):
+    """شکل یکسان متن برای جست‌وجو (حروف کوچک، یک فاصله)؛ آ و فاصله دو سر متن می‌ماند."""
+    return _SPACES.sub(" ", text.translate(_CHAR_MAP)).lower()
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def name_key(name):
+    """کلید نام تنخواه‌دار: normalize_text بدون فاصله دو سر و با ا به جای آ."""
+    return normalize_text(str(name)).strip().replace("آ", "ا")